@@ -0,0 +1,176 @@
+import os
+import struct
+
+# MPEG audio header tables, indexed by [version][layer] and [version]
+# version: 0 = MPEG 1, 1 = MPEG 2, 2 = MPEG 2.5; layer: 0 = I, 1 = II, 2 = III
+_BITRATES = {
+    (0, 0): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (0, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (0, 2): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (1, 0): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (1, 1): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (1, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = [[44100, 48000, 32000], [22050, 24000, 16000], [11025, 12000, 8000]]
+_VERSIONS = {0b11: 0, 0b10: 1, 0b00: 2}
+_LAYERS = {0b11: 0, 0b10: 1, 0b01: 2}
+
+
+def probe_duration(source):
+    """
+    Returns the duration of a WAV, MP3 or OGG file in seconds, read from its
+    headers without decoding any audio. `source` is a path or a seekable binary
+    file. Returns None if the format isn't recognized or the headers don't say.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return probe_duration(f)
+
+    source.seek(0)
+    head = source.read(12)
+    source.seek(0)
+    try:
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            return _probe_wav(source)
+        if head[:4] == b"OggS":
+            return _probe_ogg(source)
+        if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+            return _probe_mp3(source)
+    except (struct.error, ValueError, ZeroDivisionError):
+        return None
+    return None
+
+
+def _probe_wav(f):
+    """
+    Walks the RIFF chunks. Uses the fact chunk's sample count when there is one
+    (compressed formats like the ADPCM Scratch exports), else data size / byte rate.
+    """
+    f.seek(12)
+    sample_rate = byte_rate = samples = data_size = None
+
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, size = struct.unpack("<4sI", chunk)
+
+        if chunk_id == b"fmt ":
+            fmt = f.read(size)
+            sample_rate, byte_rate = struct.unpack("<II", fmt[4:12])
+        elif chunk_id == b"fact":
+            samples = struct.unpack("<I", f.read(size)[:4])[0]
+        elif chunk_id == b"data":
+            data_size = size
+            break
+        else:
+            f.seek(size, os.SEEK_CUR)
+        if size % 2:
+            f.seek(1, os.SEEK_CUR)
+
+    if samples and sample_rate:
+        return samples / sample_rate
+    if data_size is not None and byte_rate:
+        return data_size / byte_rate
+    return None
+
+
+def _parse_mp3_header(b):
+    if b[0] != 0xFF or b[1] & 0xE0 != 0xE0:
+        return None
+    version = _VERSIONS.get((b[1] >> 3) & 0b11)
+    layer = _LAYERS.get((b[1] >> 1) & 0b11)
+    bitrate_idx = b[2] >> 4
+    rate_idx = (b[2] >> 2) & 0b11
+    if version is None or layer is None or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+
+    if layer == 0:
+        samples = 384
+    elif layer == 1 or version == 0:
+        samples = 1152
+    else:
+        samples = 576
+    return {
+        "version": version,
+        "bitrate": _BITRATES[(min(version, 1), layer)][bitrate_idx] * 1000,
+        "sample_rate": _SAMPLE_RATES[version][rate_idx],
+        "samples": samples,
+        "mono": (b[3] >> 6) == 0b11,
+    }
+
+
+def _probe_mp3(f):
+    """
+    Finds the first frame and reads the Xing/Info or VBRI frame count from it.
+    Without one, the stream is treated as CBR and sized by its bitrate.
+    """
+    start = 0
+    header = f.read(10)
+    if header[:3] == b"ID3":
+        if len(header) < 10:
+            return None
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + size + (10 if header[5] & 0x10 else 0)
+
+    f.seek(start)
+    buf = f.read(65536)
+    for i in range(len(buf) - 4):
+        frame = _parse_mp3_header(buf[i:i + 4])
+        if frame:
+            break
+    else:
+        return None
+
+    # Xing/Info sits right after the side info, VBRI at a fixed offset
+    side_info = (32 if not frame["mono"] else 17) if frame["version"] == 0 else (17 if not frame["mono"] else 9)
+    xing = i + 4 + side_info
+    if buf[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", buf[xing + 4:xing + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack(">I", buf[xing + 8:xing + 12])[0]
+            return frames * frame["samples"] / frame["sample_rate"]
+    vbri = i + 4 + 32
+    if buf[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", buf[vbri + 14:vbri + 18])[0]
+        return frames * frame["samples"] / frame["sample_rate"]
+
+    end = f.seek(0, os.SEEK_END)
+    f.seek(max(end - 128, 0))
+    if f.read(3) == b"TAG":
+        end -= 128
+    return (end - start - i) * 8 / frame["bitrate"]
+
+
+def _probe_ogg(f):
+    """
+    Reads the sample rate from the Vorbis/Opus identification header and the
+    granule position (samples so far) from the last page.
+    """
+    first = f.read(27)
+    if len(first) < 27:
+        return None
+    segments = first[26]
+    f.seek(27 + segments)
+    packet = f.read(32)
+
+    pre_skip = 0
+    if packet[:7] == b"\x01vorbis":
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+    elif packet[:8] == b"OpusHead":
+        # Opus granule positions always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+    else:
+        return None
+
+    end = f.seek(0, os.SEEK_END)
+    f.seek(max(end - 65536, 0))
+    tail = f.read()
+    last = tail.rfind(b"OggS")
+    if last < 0 or last + 14 > len(tail):
+        return None
+    granule = struct.unpack("<q", tail[last + 6:last + 14])[0]
+    if granule < 0 or not sample_rate:
+        return None
+    return max(granule - pre_skip, 0) / sample_rate
@@ -1,29 +1,25 @@
 #!/usr/bin/env python3
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, abort, Response, redirect, make_response, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, abort, Response, redirect, make_response, url_for, g
 from flask_cors import CORS
 import json
 import os
 import sys
 import subprocess
-import asyncio
 import platform
 import threading
 import time
-import hashlib
-from pathlib import Path
-import base64
-import shutil
+import functools
 import tempfile
-import tkinter as tk
-from tkinter import messagebox
-import pystray
-from PIL import Image
 import logging
 from logging.handlers import RotatingFileHandler
-
-
-sys.stdout.reconfigure(encoding="utf-8")
+from urllib.parse import urlencode
+from eventbus import EventBus
+from gitstate import GitStateCache
+import metrics
+from progress import format_progress
+import jsoncodec
+from sessions import SCHEDULER_GAUGES, BuildPool, SessionManager, project_version
 
 
 LOG_FILE = os.path.join(tempfile.gettempdir(), "blockvine.log")
@@ -35,7 +31,9 @@ handler = RotatingFileHandler(
     LOG_FILE,
     maxBytes=2_000_000,
     backupCount=3,
-    encoding="utf-8"
+    encoding="utf-8",
+    # Opened on the first message, not when this module is imported
+    delay=True
 )
 
 formatter = logging.Formatter(
@@ -44,7 +42,6 @@ formatter = logging.Formatter(
 )
 
 handler.setFormatter(formatter)
-logger.addHandler(handler)
 
 class StdoutLogger:
     def write(self, message):
@@ -54,13 +51,49 @@ class StdoutLogger:
     def flush(self):
         pass
 
-sys.stdout = StdoutLogger()
-sys.stderr = StdoutLogger()
+
+def setup_logging():
+    """
+    Sends everything printed from here on to LOG_FILE.
+    """
+    sys.stdout.reconfigure(encoding="utf-8")
+    logger.addHandler(handler)
+    sys.stdout = StdoutLogger()
+    sys.stderr = StdoutLogger()
 
 
 app = Flask(__name__, template_folder="gui", static_folder=None)
 CORS(app)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response):
+    # Streaming responses (SSE, conversion logs) are timed until their headers are ready
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("http", time.perf_counter() - g.request_started, route=route, method=request.method)
+    metrics.inc("http_requests", route=route, status=response.status_code)
+    return response
+
+def reload_now():
+    session = sessions.get()
+    if session:
+        session.event_bus.publish("reload", reason="tray", path=session.proj_dir, project=session.id)
+
+
 def tray():
+    # The GUI stack is only loaded when there's a tray to show, see --headless
+    try:
+        import pystray
+        from PIL import Image
+    except ImportError as e:
+        print(f"No tray icon, its dependencies are missing: {e}")
+        return
+
     def open_logs():
         if sys.platform.startswith("win"):
             os.startfile(LOG_FILE)
@@ -75,7 +108,7 @@ def tray():
         "BlockVine is running",
         menu=pystray.Menu(
             pystray.MenuItem("Show Logs", open_logs),
-            pystray.MenuItem("Reload Now", lambda: action_queue.append("reload")),
+            pystray.MenuItem("Reload Now", reload_now),
             pystray.MenuItem("Quit", lambda: os._exit(0))
         )
     )
@@ -83,119 +116,66 @@ def tray():
 
 
 gui_dir = os.path.join(os.getcwd(), "gui")
-global cur_proj_dir
-cur_proj_dir = "none"
-global action_queue
-action_queue = []
+SB3BREAK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sb3break.py")
+# Sync/rebuild jobs of every project share these worker processes, see sessions.BuildPool
+build_pool = BuildPool()
+git_cache = GitStateCache()
+# Open projects, each with its own watcher, scheduler and event stream
+sessions = SessionManager(build_pool, git_cache)
+# "opened" notifications for editors that aren't showing a project yet
+lobby = EventBus()
+metrics.add_collector(lambda: {
+    "sessions_open": len(sessions.all()),
+    **{f"scheduler_{k}": v for k, v in sessions.stats().items() if k in SCHEDULER_GAUGES},
+}, kind="gauge")
+metrics.add_collector(lambda: {
+    **{f"scheduler_{k}": v for k, v in sessions.stats().items() if k not in SCHEDULER_GAUGES},
+    "git_cache_hits": git_cache.hits,
+    "git_cache_misses": git_cache.misses,
+    "git_subprocesses": git_cache.stats()["subprocesses"],
+    "events_published": lobby.latest + sessions.events_published(),
+})
 watch_dir = os.path.expanduser("~/BlockVine")
-os.makedirs(watch_dir, exist_ok=True)
 state_file = os.path.join(tempfile.gettempdir(), "known_sb3.json")
 
 
-def rebuild_reload():
-    print(f"Reloading!")
-    try:
-        subprocess.run([sys.executable, "sb3rebuild.py",
-                       cur_proj_dir], check=True)
-        print(f"Reload OK")
-    except Exception as e:
-        print(f"Failed to reload: {e}")
-        return False
-    action_queue.append("reload")
-    return True
+def request_project():
+    """
+    The project id a request is for: ?project=..., a form field or a JSON "project" key.
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    return (request.values.get("project")
+            or (body.get("project") if isinstance(body, dict) else None))
 
 
-def break_sync():
-    print(f"Syncing with editor!")
-    try:
-        if "BlockVine" in cur_proj_dir:
-            cpd = Path(cur_proj_dir)
-            shutil.rmtree(cpd / "src", ignore_errors=True)
-            shutil.rmtree(cpd / "assets", ignore_errors=True)
-            shutil.rmtree(cpd / "_bvcache", ignore_errors=True)
-            subprocess.run([sys.executable, "sb3break.py",
-                           f"{cur_proj_dir}.sb3"], check=True)
-        else:
-            raise Exception("Current project directory is not a BlockVine directory.")
-        print(f"Sync OK")
-    except Exception as e:
-        print(f"Failed to sync: {e}")
-        return False
-    return True
+def current_session():
+    """
+    The session the request is for, or the default one when it doesn't name any.
+    Naming a project that isn't open is a 404.
+    """
+    pid = request_project()
+    session = sessions.get(pid)
+    if pid and session is None:
+        abort(404, description=f"Project {pid} is not open.")
+    return session
 
 
-IGNORED_DIRS = {"__pycache__", "_bvcache", ".git"}
-IGNORED_SUFFIXES = {".pyc", ".tmp"}
+def current_dir():
+    session = current_session()
+    return session.proj_dir if session else "none"
 
 
-def snapshot_dir(root):
-    h = hashlib.sha256()
+@functools.cache
+def system_username():
+    # Doesn't change while we run, and every page shows it
+    return subprocess.run("whoami", capture_output=True, text=True).stdout
 
-    for base, dirs, files in os.walk(root):
-        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
 
-        for name in sorted(files):
-            if name.endswith(tuple(IGNORED_SUFFIXES)):
-                continue
-
-            path = os.path.join(base, name)
-            try:
-                stat = os.stat(path)
-                h.update(path.encode())
-                h.update(str(stat.st_mtime).encode())
-                h.update(str(stat.st_size).encode())
-            except FileNotFoundError:
-                pass
-
-    return h.hexdigest()
-
-
-def snapshot_file(path):
-    try:
-        stat = os.stat(path)
-    except FileNotFoundError:
-        return None
-
-    h = hashlib.sha256()
-    h.update(path.encode())
-    h.update(str(stat.st_mtime).encode())
-    h.update(str(stat.st_size).encode())
-    return h.hexdigest()
-
-
-def watch_project_dir():
-    global cur_proj_dir, action_queue
-
-    last_dir_hash = None
-    last_sb3_hash = None
-
-    while True:
-        time.sleep(1)
-
-        if not cur_proj_dir or cur_proj_dir == "none":
-            continue
-        if not os.path.isdir(cur_proj_dir):
-            continue
-
-        sb3_path = f"{cur_proj_dir}.sb3"
-
-        try:
-            dir_hash = snapshot_dir(cur_proj_dir)
-            sb3_hash = snapshot_file(sb3_path)
-
-            if last_dir_hash and dir_hash != last_dir_hash:
-                rebuild_reload()
-                sb3_hash = snapshot_file(sb3_path)
-
-            if last_sb3_hash and sb3_hash != last_sb3_hash:
-                break_sync()
-                dir_hash = snapshot_dir(cur_proj_dir)
-
-            last_dir_hash = dir_hash
-            last_sb3_hash = sb3_hash
-
-        except Exception as e:
-            print(f"[Watcher] Error: {e}")
+@app.context_processor
+def project_query():
+    # Lets the GUI pages keep the editor's project and window in their links
+    params = {k: request.args[k] for k in ("project", "client") if request.args.get(k)}
+    return {"query": urlencode(params)}
 
 
 def get_known_files():
@@ -222,72 +202,31 @@ def get_new_sb3_files():
     return list(new)
 
 
-if os.path.exists(state_file):
-    try:
-        os.remove(state_file)
-        print(f"Removed previous state file: {state_file}")
-    except Exception as e:
-        print(f"Could not remove {state_file}: {e}")
-get_new_sb3_files()
-exsb3 = get_known_files()
-print(f"Existing SB3s found: {exsb3}")
-
-
-def get_git(proj_dir):
-    try:
-        subprocess.run(["git", "-C", proj_dir, "rev-parse", "--is-inside-work-tree"],
-                       check=True, capture_output=True)
-
-        branches = subprocess.run(
-            ["git", "-C", proj_dir, "branch", "-a",
-                "--format", "%(refname:short)"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().split("\n")
-
-        unstaged = subprocess.run(
-            ["git", "-C", proj_dir, "status", "--porcelain"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().split("\n")
-
-        branches = [b for b in branches if b]
-        unstaged = [u for u in unstaged if u]
-
-        return branches, unstaged
-
-    except subprocess.CalledProcessError:
-        return [], []
-
-
-def get_git_history(proj_dir, limit=32):
-    try:
-        out = subprocess.run(
-            [
-                "git", "-C", proj_dir, "log",
-                f"--max-count={limit}",
-                "--pretty=format:%h|%an|%ad|%s",
-                "--date=short"
-            ],
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-
-        commits = []
-        for line in out.split("\n"):
-            if not line:
-                continue
-            h, author, date, msg = line.split("|", 3)
-            commits.append({
-                "hash": h,
-                "author": author,
-                "date": date,
-                "message": msg
-            })
+def reset_known_files():
+    """
+    Forgets the .sb3s of the previous run and remembers the ones there now,
+    so only files dropped in from here on count as new.
+    """
+    if os.path.exists(state_file):
+        try:
+            os.remove(state_file)
+            print(f"Removed previous state file: {state_file}")
+        except Exception as e:
+            print(f"Could not remove {state_file}: {e}")
+    get_new_sb3_files()
+    print(f"Existing SB3s found: {get_known_files()}")
 
-        return commits
 
-    except subprocess.CalledProcessError:
-        return []
+def startup(headless=False):
+    """
+    What running the server needs besides importing this module: the log file,
+    ~/BlockVine and its known .sb3s, and the tray icon unless `headless`.
+    """
+    setup_logging()
+    os.makedirs(watch_dir, exist_ok=True)
+    reset_known_files()
+    if not headless:
+        threading.Thread(target=tray, daemon=True).start()
 
 
 def open_terminal(path=None, command=None):
@@ -342,29 +281,28 @@ def ping():
 @app.route("/gui", defaults={"path": "index.html"})
 @app.route("/gui/<path:path>")
 def serve_file(path):
-    global cur_proj_dir
     full_path = os.path.join(gui_dir, path)
-    branches, unstaged = get_git(cur_proj_dir)
-    history = get_git_history(cur_proj_dir)
     if not path.endswith(".html"):
         if os.path.isfile(full_path):
             return send_from_directory(gui_dir, path)
         else:
             return abort(404)
     if os.path.isfile(full_path):
-        if not cur_proj_dir == "none":
+        proj_dir = current_dir()
+        git_state = git_cache.get(proj_dir)
+        if not proj_dir == "none":
             template_name = os.path.relpath(full_path, gui_dir)
         else:
             template_name = "onboarding.html"
         return render_template(
             template_name,
-            projectDir=cur_proj_dir,
-            projectName=os.path.basename(cur_proj_dir),
-            sys_username=subprocess.run(
-                "whoami", capture_output=True, text=True).stdout,
-            branches=branches or ["⚠️ No branches found."],
-            unstaged=unstaged,
-            history=history
+            projectDir=proj_dir,
+            projectName=os.path.basename(proj_dir),
+            sys_username=system_username(),
+            branches=git_state["branches"] or ["⚠️ No branches found."],
+            unstaged=git_state["unstaged"],
+            history=git_state["history"],
+            history_next=git_state["history_next"]
         )
     else:
         return abort(404)
@@ -372,29 +310,162 @@ def serve_file(path):
 
 @app.route("/cmd/getInfo")
 def getInfo():
-    global cur_proj_dir, action_queue
-    branches, unstaged = get_git(cur_proj_dir)
-    history = get_git_history(cur_proj_dir)
-    aq = action_queue.copy()
-    action_queue.pop() if action_queue else None
-
-    sb3_path = f"{cur_proj_dir}.sb3"
-    projdata = None
-
-    if os.path.exists(sb3_path):
-        with open(sb3_path, "rb") as f:
-            projdata = base64.b64encode(f.read()).decode("utf-8")
+    session = current_session()
+    proj_dir = session.proj_dir if session else "none"
+    git_state = git_cache.get(proj_dir)
 
     return jsonify(
-        path=cur_proj_dir,
-        branches=branches,
-        unstaged=unstaged,
-        action_queue=aq,
-        projdata=projdata,
-        history=history
+        path=proj_dir,
+        project=session.id if session else None,
+        branches=git_state["branches"],
+        unstaged=git_state["unstaged"],
+        branch=git_state["branch"],
+        ahead=git_state["ahead"],
+        behind=git_state["behind"],
+        seq=session.event_bus.latest if session else lobby.latest,
+        version=project_version(f"{proj_dir}.sb3"),
+        history=git_state["history"],
+        history_next=git_state["history_next"]
     ), 200
 
 
+@app.route("/cmd/events")
+def events():
+    """
+    Server-Sent Events stream of reload/sync events for ?project=..., or of
+    "opened" events when no project is given. Each event id is resumable:
+    browsers send it back as Last-Event-ID when they reconnect.
+    A project that isn't open (closed, or the backend restarted) gets the lobby
+    stream rather than a 404, which EventSource would never retry after.
+    """
+    pid = request.args.get("project")
+    session = sessions.get(pid) if pid else None
+    event_bus = session.event_bus if session else lobby
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    since = event_bus.parse_id(last_id) if session or not pid else None
+
+    def generate():
+        seq = event_bus.latest if since is None else since
+        yield "retry: 1000\n\n"
+        while True:
+            batch = event_bus.since(seq, timeout=15)
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            for event in batch:
+                seq = max(seq, event["seq"])
+                yield f"id: {event_bus.event_id(event['seq'])}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/cmd/project.sb3")
+def project_file():
+    """
+    Raw project bytes. The version from getInfo doubles as the ETag, so clients
+    can revalidate with If-None-Match; Range requests are supported as well.
+    """
+    session = current_session()
+    version = project_version(session.sb3_path) if session else None
+    if version is None:
+        return abort(404)
+    # Whoever downloads this version may ask for deltas against it later
+    if version not in session.summaries:
+        session.pool.later(session.summary)
+
+    response = send_file(
+        session.sb3_path,
+        mimetype="application/x.scratch.sb3",
+        conditional=True,
+        etag=version,
+        max_age=0
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/cmd/projectDelta")
+def projectDelta():
+    """
+    The sprites that changed since the version in ?since=, so the editor can patch
+    them in instead of reloading the whole project. Says full=true (and why) when
+    that isn't possible, e.g. after asset or stage changes.
+    """
+    session = current_session()
+    if session is None:
+        return abort(404)
+    delta = session.delta(request.args.get("since"))
+    targets = delta.pop("targets", [])
+    # The sprites' JSON is already serialized, so it's spliced in as is
+    body = jsoncodec.dumpb(delta)[:-1] + b',"targets":[' + b",".join(targets) + b"]}"
+    return Response(body, mimetype="application/json", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/cmd/history")
+def history():
+    """
+    A page of commit history, newest first: ?branch= (default: the checked out one),
+    ?limit= (default 32, at most 200) and ?cursor= from the previous page's "next",
+    which is null on the last page.
+    """
+    proj_dir = current_dir()
+    state = git_cache.get(proj_dir)
+    if state["head"] is None:
+        return jsonify(branch=None, head=None, commits=[], next=None), 200
+
+    repo = git_cache.repo(proj_dir)
+    branch = request.args.get("branch")
+    if branch:
+        head = repo.resolve(branch)
+        if head is None:
+            return f"No such branch: {branch}", 404
+    else:
+        branch, head = state["branch"], state["head"]
+    try:
+        limit = min(max(int(request.args.get("limit", 32)), 1), 200)
+    except ValueError:
+        return "limit must be a number", 400
+
+    try:
+        commits, next_cursor = repo.history(branch, head, request.args.get("cursor"), limit)
+    except LookupError as e:
+        return str(e), 400
+    return jsonify(branch=branch, head=head, commits=commits, next=next_cursor), 200
+
+
+@app.route("/cmd/gitStats")
+def gitStats():
+    return jsonify(git_cache.stats()), 200
+
+
+@app.route("/cmd/buildStats")
+def buildStats():
+    if request_project():
+        return jsonify(current_session().stats()), 200
+    return jsonify(sessions.stats()), 200
+
+
+@app.route("/cmd/projects")
+def projects():
+    default = sessions.get()
+    return jsonify([{
+        "project": session.id,
+        "path": session.proj_dir,
+        "version": project_version(session.sb3_path),
+        "default": session is default,
+    } for session in sessions.all()]), 200
+
+
+@app.route("/cmd/metrics")
+def metrics_endpoint():
+    """
+    Timing histograms and counters in the Prometheus text format.
+    Set BLOCKVINE_SLOW_MS to also log every span slower than that.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/modal/folderpicker")
 def md_folderpicker():
     home = os.path.expanduser("~")
@@ -411,17 +482,30 @@ def md_folderpicker():
 
 @app.route("/modal/convproject")
 def md_convproject():
-    return render_template("modals/convproject.html", sys_username=subprocess.run(
-        "whoami", capture_output=True, text=True).stdout)
+    return render_template("modals/convproject.html", sys_username=system_username())
 
 
 @app.route("/cmd/openProject", methods=['POST', 'GET'])
 def openproject():
-    global cur_proj_dir
-    global action_queue
-    cur_proj_dir = request.values.get('path')
-    action_queue.append("reload")
-    return redirect("/gui")
+    """
+    Opens `path` (or closes the requesting window's project for "none") and tells
+    the editor window that asked, identified by `client`, to switch to it.
+    """
+    path = request.values.get('path')
+    client = request.values.get('client')
+    previous = sessions.get(request_project()) if request_project() else None
+
+    if not path or path == "none":
+        if previous:
+            sessions.close(previous.id)
+        return redirect(url_for("serve_file", **({"client": client} if client else {})))
+
+    session = sessions.open(path)
+    event = dict(path=session.proj_dir, project=session.id, client=client)
+    lobby.publish("opened", **event)
+    if previous and previous is not session:
+        previous.event_bus.publish("opened", **event)
+    return redirect(url_for("serve_file", project=session.id, **({"client": client} if client else {})))
 
 
 @app.route("/cmd/checkConv", methods=["POST", "GET"])
@@ -439,6 +523,7 @@ def checkconv():
 @app.route("/cmd/runConv/<files>")
 def conview(files):
     file_list = files.split(",")
+    query = project_query()["query"]
     print(f"[ Op ] Files to convert: {file_list}")
 
     def generate():
@@ -448,44 +533,50 @@ def conview(files):
         <link rel=\"stylesheet\" href=\"/gui/assets/style.css\"
         </head><body>
         """
-        for f in file_list:
-            path = os.path.join(watch_dir, f)
-            yield f"<h2>Converting {f}...</h2>"
-            print(f"\nRunning sb3break.py on {f}...\n")
+        yield f"<h2>Converting {', '.join(file_list)}...</h2>"
+        print(f"\nRunning sb3break on {len(file_list)} file(s)...\n")
+        paths = [os.path.join(watch_dir, f) for f in file_list]
+        # One sb3break process converts them all, several at a time within its memory budget
+        proc = subprocess.Popen(
+            [sys.executable, SB3BREAK, *paths, "--git", "--json"],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8"
+        )
+        errors = {}
+        for raw in proc.stdout:
             try:
-                process = subprocess.Popen(
-                    [sys.executable, "sb3break.py", path, "--git"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                )
-                for line in iter(process.stdout.readline, ""):
-                    if line.startswith("[ "):
-                        yield f"<div class=\"pane\"><h4>{line}</h4></div>"
-                    print(f"[ Op ] {line}")
-                process.wait()
-                yield f"<div class=\"pane docked\"><h3>Finished</h3>{f}<br><br>"
-                yield f"<button onclick=\"window.location='/modal/folderpicker'\">Continue</button></div></body></html>"
-                print(f"\n--- Finished {f} ---\n")
-            except Exception as e:
-                yield f"<div class=\"pane p-error\"><h3>Error converting {f}</h3>{e}<br><br></div></body></html>"
-                print(f"\nError running sb3break.py on {f}: {e}\n")
+                event = jsoncodec.loads(raw)
+            except ValueError:
+                print(f"[ Op ] {raw.rstrip()}")
+                continue
+            f = os.path.basename(event.get("file", ""))
+            line = format_progress(event)
+            if event["stage"] == "done" and event["level"] == "error":
+                errors[f] = event["message"]
+            yield f"<div class=\"pane\"><h4>{f}: {line}</h4></div>"
+            print(f"[ Op ] {f}: {line}")
+        proc.wait()
+
+        for f in file_list:
+            if f in errors:
+                yield f"<div class=\"pane p-error\"><h3>Error converting {f}</h3>{errors[f]}<br><br></div>"
+                print(f"\nError running sb3break on {f}: {errors[f]}\n")
+        if proc.returncode and not errors:
+            yield f"<div class=\"pane p-error\"><h3>Error converting</h3>sb3break exited with code {proc.returncode}<br><br></div>"
+        done = [f for f in file_list if f not in errors]
+        yield f"<div class=\"pane docked\"><h3>Finished</h3>{'<br>'.join(done) or 'Nothing was converted.'}<br><br>"
+        yield f"<button onclick=\"window.location='/modal/folderpicker?{query}'\">Continue</button></div></body></html>"
+        print(f"\n--- Finished {len(done)} of {len(file_list)} ---\n")
 
     return Response(generate(), mimetype='text/html')
 
 
 @app.route("/cmd/stage", methods=["POST"])
 def stage():
-    global cur_proj_dir
+    proj_dir = current_dir()
     file = request.get_json().get("file")
 
     try:
-        subprocess.run(
-            ["git", "-C", cur_proj_dir, "add", file],
-            check=True,
-            capture_output=True,
-            text=True
-        )
+        git_cache.repo(proj_dir).stage(file)
         return "", 204
 
     except subprocess.CalledProcessError as e:
@@ -495,14 +586,11 @@ def stage():
 
 @app.route("/cmd/unstage", methods=["POST"])
 def unstage():
-    global cur_proj_dir
+    proj_dir = current_dir()
     file = request.get_json().get("file")
 
     try:
-        subprocess.run(
-            ["git", "-C", cur_proj_dir, "restore", "--staged", file],
-            check=True
-        )
+        git_cache.repo(proj_dir).unstage(file)
         return "", 204
     except subprocess.CalledProcessError as e:
         return str(e), 500
@@ -510,18 +598,11 @@ def unstage():
 
 @app.route("/cmd/commit", methods=["POST"])
 def commit():
-    global cur_proj_dir
-    global action_queue
+    proj_dir = current_dir()
     msg = request.get_json().get("message")
 
     try:
-        subprocess.run(
-            ["git", "-C", cur_proj_dir, "commit", "-m", msg],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        # action_queue.append("reload")
+        git_cache.repo(proj_dir).commit(msg)
         return "", 204
     except subprocess.CalledProcessError as e:
         return e.stderr or str(e), 500
@@ -529,11 +610,11 @@ def commit():
 
 @app.route("/cmd/push", methods=["POST"])
 def push():
-    global cur_proj_dir
+    proj_dir = current_dir()
     try:
         open_terminal(
-            path=cur_proj_dir,
-            command=f"git -C {cur_proj_dir} push origin")
+            path=proj_dir,
+            command=f"git -C {proj_dir} push origin")
         return "", 204
     except Exception as e:
         return str(e), 500
@@ -541,11 +622,11 @@ def push():
 
 @app.route("/cmd/pull", methods=["POST"])
 def pull():
-    global cur_proj_dir
+    proj_dir = current_dir()
     try:
         open_terminal(
-            path=cur_proj_dir,
-            command=f"git -C {cur_proj_dir} pull origin --rebase"),
+            path=proj_dir,
+            command=f"git -C {proj_dir} pull origin --rebase"),
         return "", 204
     except Exception as e:
         return str(e), 500
@@ -553,18 +634,13 @@ def pull():
 
 @app.route("/cmd/checkout", methods=["POST"])
 def checkout():
-    global cur_proj_dir
-    global action_queue
+    proj_dir = current_dir()
     branch = request.get_json().get("branch")
 
     try:
-        subprocess.run(
-            ["git", "-C", cur_proj_dir, "checkout", branch],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        action_queue.append("reload")
+        git_cache.repo(proj_dir).checkout(branch)
+        # No reload event here: the watcher sees the checked-out tree, rebuilds,
+        # and publishes the reload once the new .sb3 actually exists
         return "", 204
 
     except subprocess.CalledProcessError as e:
@@ -574,16 +650,38 @@ def checkout():
 
 @app.route("/cmd/openShell", methods=['POST', 'GET'])
 def openshell():
-    global cur_proj_dir
-    print(cur_proj_dir)
-    result = open_terminal(path=cur_proj_dir)
+    proj_dir = current_dir()
+    print(proj_dir)
+    result = open_terminal(path=proj_dir)
     if not result == "ok":
         return result, 500
     else:
         return "Shell OK", 200
 
 
+def serve(host="127.0.0.1", port=8617):
+    """
+    Serves the app on waitress when it's installed, on a pool of
+    BLOCKVINE_HTTP_THREADS threads, so a slow git call or a build only holds up
+    the request that waits for it. Every open /cmd/events stream keeps a thread
+    for itself, hence the generous default. Falls back to Werkzeug's threaded
+    development server without waitress, or with BLOCKVINE_SERVER=werkzeug.
+    """
+    threads = int(os.environ.get("BLOCKVINE_HTTP_THREADS") or 32)
+    if os.environ.get("BLOCKVINE_SERVER") != "werkzeug":
+        try:
+            from waitress import create_server
+        except ImportError:
+            print("waitress isn't installed, falling back to the development server")
+        else:
+            server = create_server(app, host=host, port=port, threads=threads, ident="BlockVine")
+            print(f"Serving on http://{host}:{port} (waitress, {threads} threads)")
+            server.run()
+            return
+    app.run(host=host, port=port, debug=False, threaded=True)
+
+
 if __name__ == '__main__':
-    threading.Thread(target=watch_project_dir, daemon=True).start()
-    threading.Thread(target=tray, daemon=True).start()
-    app.run(host='127.0.0.1', port=8617, debug=False)
+    # --headless: no tray, so pystray and Pillow are never imported
+    startup(headless="--headless" in sys.argv)
+    serve()
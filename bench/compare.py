@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Compares two bench/run.py result files stage by stage (best times).
+
+    python bench/compare.py old.json new.json
+"""
+
+import json
+import sys
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python bench/compare.py <old.json> <new.json>")
+        sys.exit(1)
+
+    old, new = load(sys.argv[1]), load(sys.argv[2])
+    if old["params"] != new["params"]:
+        print(f"[ WARN ] Different project parameters: {old['params']} vs {new['params']}")
+
+    print(f"{'stage':<20}{(old['commit'] or '?')[:10]:>12}{(new['commit'] or '?')[:10]:>12}{'change':>10}")
+    for stage in dict.fromkeys([*old["results"], *new["results"]]):
+        before, after = old["results"].get(stage, {}), new["results"].get(stage, {})
+        # Timings, or the peak memory for rebuild_sb3_rss
+        field, unit = ("peak_rss_mb", "M") if "peak_rss_mb" in {**before, **after} else ("best", "s")
+        a, b = before.get(field), after.get(field)
+        if a is None or b is None:
+            print(f"{stage:<20}{'-' if a is None else f'{a:.3f}{unit}':>12}{'-' if b is None else f'{b:.3f}{unit}':>12}")
+            continue
+        print(f"{stage:<20}{a:>11.3f}{unit}{b:>11.3f}{unit}{(b - a) / a * 100:>+9.1f}%")
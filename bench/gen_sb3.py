@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic .sb3 generator for the benchmarks.
+The same parameters and seed always give a byte-identical file.
+
+    python bench/gen_sb3.py out.sb3 [--tier medium] [--sprites N] [--blocks N]
+                                    [--list-size N] [--assets N] [--asset-kb N] [--seed N]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import struct
+import zipfile
+
+# sprites, blocks per sprite, items per list, asset count, asset size (KB)
+TIERS = {
+    "small": dict(sprites=5, blocks=50, list_size=50, assets=10, asset_kb=8),
+    "medium": dict(sprites=50, blocks=400, list_size=500, assets=100, asset_kb=64),
+    "large": dict(sprites=100, blocks=400, list_size=2000, assets=300, asset_kb=256),
+    # 112,500 blocks and ~1 GB of assets
+    "huge": dict(sprites=250, blocks=450, list_size=5000, assets=1000, asset_kb=1024),
+}
+
+# Fixed member timestamp, so the archive bytes don't depend on when it was made
+ZIP_DATE = (2020, 1, 1, 0, 0, 0)
+
+OPCODES = [
+    ("motion_movesteps", "STEPS"),
+    ("motion_turnright", "DEGREES"),
+    ("motion_changexby", "DX"),
+    ("looks_changesizeby", "CHANGE"),
+    ("control_wait", "DURATION"),
+    ("sound_changevolumeby", "VOLUME"),
+]
+
+
+def _block_id(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789!#%()*+,-./:;=?@[]^_`{|}~") for _ in range(20))
+
+
+def make_blocks(rng, count):
+    """
+    `count` blocks as scripts of up to 20, each headed by a green flag hat.
+    """
+    blocks = {}
+    made = 0
+    while made < count:
+        length = min(20, count - made)
+        ids = [_block_id(rng) for _ in range(length)]
+        for i, block_id in enumerate(ids):
+            if i == 0:
+                blocks[block_id] = {
+                    "opcode": "event_whenflagclicked", "next": ids[1] if length > 1 else None,
+                    "parent": None, "inputs": {}, "fields": {}, "shadow": False, "topLevel": True,
+                    "x": rng.randrange(0, 2000), "y": rng.randrange(0, 2000),
+                }
+                continue
+            opcode, input_name = rng.choice(OPCODES)
+            blocks[block_id] = {
+                "opcode": opcode, "next": ids[i + 1] if i + 1 < length else None,
+                "parent": ids[i - 1], "inputs": {input_name: [1, [4, str(rng.randrange(-100, 100))]]},
+                "fields": {}, "shadow": False, "topLevel": False,
+            }
+        made += length
+    return blocks
+
+
+def _svg(rng, size):
+    body = f'<svg xmlns="http://www.w3.org/2000/svg" width="{rng.randrange(10, 480)}" height="{rng.randrange(10, 360)}">'
+    filler = "".join(f'<rect x="{rng.randrange(480)}" y="{rng.randrange(360)}" width="4" height="4"/>' for _ in range(size // 48))
+    return (body + filler + "</svg>").encode("utf-8")
+
+
+def _png(rng, size):
+    return b"\x89PNG\r\n\x1a\n" + rng.randbytes(max(size - 8, 0))
+
+
+def _wav(rng, size):
+    # 22.05 kHz 16-bit mono, so 1 KB is ~23 ms: anything past ~220 KB counts as bgm
+    data = rng.randbytes(max(size - 44, 0))
+    return (b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, 22050, 44100, 2, 16)
+            + b"data" + struct.pack("<I", len(data)) + data)
+
+
+def make_asset(rng, index, size):
+    kind = index % 3
+    if kind == 0:
+        return "svg", _svg(rng, size)
+    if kind == 1:
+        return "png", _png(rng, size)
+    return "wav", _wav(rng, size)
+
+
+def generate_sb3(path, sprites=10, blocks=100, list_size=100, assets=10, asset_kb=16, seed=0):
+    """
+    Writes a synthetic project to `path` and returns some totals about it.
+    Assets are spread round-robin over the sprites as costumes (svg/png) or sounds (wav).
+    """
+    rng = random.Random(seed)
+    targets = [{
+        "isStage": True, "name": "Stage",
+        "variables": {"stagevar": ["my variable", 0]},
+        "lists": {"stagelist": ["stage list", list(range(list_size))]},
+        "broadcasts": {}, "blocks": {}, "comments": {}, "currentCostume": 0,
+        "costumes": [], "sounds": [], "volume": 100, "layerOrder": 0,
+        "tempo": 60, "videoTransparency": 50, "videoState": "on", "textToSpeechLanguage": None,
+    }]
+    for i in range(sprites):
+        targets.append({
+            "isStage": False, "name": f"Sprite{i + 1}",
+            "variables": {f"var{i}": [f"score {i}", rng.randrange(1000)]},
+            "lists": {f"list{i}": [f"items {i}", [rng.choice(["a", "b", 1, 2.5, "é"]) for _ in range(list_size)]]},
+            "broadcasts": {}, "blocks": make_blocks(rng, blocks), "comments": {},
+            "currentCostume": 0, "costumes": [], "sounds": [], "volume": 100, "layerOrder": i + 1,
+            "visible": True, "x": 0, "y": 0, "size": 100, "direction": 90, "draggable": False,
+            "rotationStyle": "all around",
+        })
+
+    asset_bytes = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(assets):
+            ext, data = make_asset(rng, i, asset_kb * 1024)
+            md5 = hashlib.md5(data).hexdigest()
+            target = targets[i % len(targets)]
+            entry = {"name": f"asset{i}", "assetId": md5, "md5ext": f"{md5}.{ext}", "dataFormat": ext}
+            if ext == "wav":
+                target["sounds"].append({**entry, "rate": 22050, "sampleCount": (len(data) - 44) // 2})
+            else:
+                target["costumes"].append({**entry, "rotationCenterX": 0, "rotationCenterY": 0})
+
+            info = zipfile.ZipInfo(entry["md5ext"], ZIP_DATE)
+            # Random bytes don't compress, store them like sb3rebuild does
+            info.compress_type = zipfile.ZIP_DEFLATED if ext == "svg" else zipfile.ZIP_STORED
+            zf.writestr(info, data)
+            asset_bytes += len(data)
+
+        project = {"targets": targets, "monitors": [], "extensions": [],
+                   "meta": {"semver": "3.0.0", "vm": "0.2.0", "agent": "blockvine-bench"}}
+        info = zipfile.ZipInfo("project.json", ZIP_DATE)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        project_json = json.dumps(project, separators=(",", ":")).encode("utf-8")
+        zf.writestr(info, project_json)
+
+    return {"sprites": sprites, "blocks": sprites * blocks, "assets": assets,
+            "asset_bytes": asset_bytes, "project_json_bytes": len(project_json)}
+
+
+def tier_params(tier, **overrides):
+    params = dict(TIERS[tier])
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic .sb3 for benchmarking.")
+    parser.add_argument("out")
+    parser.add_argument("--tier", choices=TIERS, default="small")
+    for name in ("sprites", "blocks", "list-size", "assets", "asset-kb"):
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    params = tier_params(args.tier, sprites=args.sprites, blocks=args.blocks, list_size=args.list_size,
+                         assets=args.assets, asset_kb=args.asset_kb)
+    totals = generate_sb3(args.out, seed=args.seed, **params)
+    print(f"[ OK ] {args.out}: " + ", ".join(f"{k} {v}" for k, v in totals.items()))
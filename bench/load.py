@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Load test: many editor tabs polling /cmd/getInfo at once, reporting tail latency.
+
+    python bench/load.py --serve PROJECT_DIR [--server waitress|werkzeug] [--clients N]
+                         [--duration S] [--churn S] [--out results.json]
+    python bench/load.py --url http://127.0.0.1:8617 --project ID ...
+
+With --serve, a headless backend.py is started in a child process on a free
+port with the project opened. --churn touches the project's .git/index every S seconds, so git state
+has to be re-read while the clients keep polling, the way staging files does.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+
+OUT = sys.stdout
+
+# Run in the child: open the project and serve until killed
+SERVER = """
+import os, sys
+import backend
+backend.startup(headless=True)
+session = backend.sessions.open(sys.argv[1])
+print(session.id, file=sys.__stdout__, flush=True)
+backend.serve(port=int(sys.argv[2]))
+"""
+
+
+def log(message):
+    print(message, file=OUT, flush=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(project_dir, server):
+    port = free_port()
+    env = {**os.environ, "BLOCKVINE_SERVER": server}
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(project_dir), str(port)],
+                            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+    project = proc.stdout.readline().strip()
+    if not project:
+        proc.kill()
+        raise SystemExit("[ ERROR ] backend.py didn't start")
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc, f"http://127.0.0.1:{port}", project
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("[ ERROR ] backend.py didn't start listening")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run(url, project, clients, duration, churn_dir=None, churn=None):
+    parts = urlsplit(url)
+    path = "/cmd/getInfo" + (f"?{urlencode({'project': project})}" if project else "")
+    stop = threading.Event()
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+
+    def client(i):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+            if ok:
+                latencies[i].append(time.perf_counter() - started)
+            else:
+                errors[i] += 1
+        conn.close()
+
+    def churner():
+        index = Path(churn_dir) / ".git" / "index"
+        while not stop.wait(churn):
+            os.utime(index)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    if churn_dir and churn:
+        threads.append(threading.Thread(target=churner, daemon=True))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    values = sorted(v for client_latencies in latencies for v in client_latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "requests": len(values),
+        "errors": sum(errors),
+        "rps": len(values) / elapsed,
+        "mean_ms": ms(statistics.fmean(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p90_ms": ms(percentile(values, 0.90)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1] if values else None),
+    }
+
+
+def git_stats(url):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+    try:
+        conn.request("GET", "/cmd/gitStats")
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hammer /cmd/getInfo with concurrent clients.")
+    parser.add_argument("--serve", help="project folder to start a backend for")
+    parser.add_argument("--server", choices=("waitress", "werkzeug"), default="waitress")
+    parser.add_argument("--url", default="http://127.0.0.1:8617", help="backend to test without --serve")
+    parser.add_argument("--project", help="project id to ask about without --serve")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--churn", type=float, help="touch .git/index every CHURN seconds (with --serve)")
+    parser.add_argument("--out", help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    proc = None
+    url, project, project_dir = args.url, args.project, args.serve
+    if args.serve:
+        proc, url, project = start_server(Path(args.serve).resolve(), args.server)
+    try:
+        log(f"[ bench ] {args.clients} clients polling {url}/cmd/getInfo for {args.duration:g}s"
+            + (f", .git/index touched every {args.churn:g}s" if args.churn else ""))
+        results = run(url, project, args.clients, args.duration, project_dir, args.churn)
+        results["git"] = git_stats(url)
+    finally:
+        if proc:
+            proc.kill()
+            proc.wait()
+
+    results.update(server=args.server if args.serve else None, clients=args.clients,
+                   duration=args.duration, churn=args.churn)
+    log(f"[ bench ] {results['requests']} requests ({results['rps']:.0f}/s), {results['errors']} errors")
+    log(f"[ bench ] latency p50 {results['p50_ms']}ms, p90 {results['p90_ms']}ms, "
+        f"p99 {results['p99_ms']}ms, max {results['max_ms']}ms")
+    log(f"[ bench ] git: {results['git']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        log(f"[ OK ] Results written to {args.out}")
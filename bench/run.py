@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Times BlockVine's pipeline on a synthetic project and writes the results as JSON,
+so runs from different commits can be compared with bench/compare.py.
+
+    python bench/run.py [--tier small|medium|large|huge] [--repeat N] [--only stage,...]
+                        [--layout flat|scripts] [--out results.json] [--workdir DIR] [--keep]
+
+The getInfo and save_reload stages import backend.py, which needs Flask;
+without it they are reported as skipped.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path[:0] = [str(ROOT), str(BENCH_DIR)]
+
+import jsoncodec
+from fswatch import snapshot_dir
+from gen_sb3 import TIERS, generate_sb3, tier_params
+from jsonbreak import LAYOUTS
+from jsonrebuild import FragmentCache, rebuild_json
+from sb3break import init_git, organize_sb3, sync_sb3
+from sb3rebuild import rebuild_sb3
+
+OUT = sys.stdout
+
+STAGES = [
+    "organize_sb3", "rebuild_json", "rebuild_sb3_cold", "rebuild_sb3_rss", "rebuild_sb3_warm", "rebuild_sb3_edit",
+    "snapshot_dir", "sync_sb3", "getInfo_cold", "getInfo_warm", "save_reload",
+]
+
+
+class Skipped(Exception):
+    pass
+
+
+def git_commit():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def log(message):
+    print(message, file=OUT, flush=True)
+
+
+def measure(fn, repeat, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {"best": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def quietly(fn, *args):
+    # rebuild_json prints every directory it visits
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args)
+
+
+# Starts the measured process from a small one: Linux counts the RSS of the
+# process that forks it into the child's ru_maxrss, and the bench itself is big
+RSS_LAUNCHER = """
+import os, subprocess, sys
+proc = subprocess.Popen([sys.executable, *sys.argv[1:]], stdout=subprocess.DEVNULL)
+_, status, usage = os.wait4(proc.pid, 0)
+print(os.waitstatus_to_exitcode(status), usage.ru_maxrss)
+"""
+
+
+def peak_rss(*args):
+    """
+    Runs a Python script in a child process and returns its peak RSS in MB.
+    """
+    if not hasattr(os, "wait4"):
+        raise Skipped("measuring peak RSS needs os.wait4")
+    out = subprocess.run([sys.executable, "-c", RSS_LAUNCHER, *args], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    code, maxrss = map(int, out.split())
+    if code:
+        raise subprocess.CalledProcessError(code, args)
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    return maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def count_entries(path):
+    """
+    Files and folders under path, i.e. roughly the inodes the tree costs.
+    """
+    return sum(len(dirs) + len(files) for _, dirs, files in os.walk(path))
+
+
+def edit_fragment(project_dir, n):
+    """
+    Changes one sprite's x position, the way an editor saving a fragment would.
+    """
+    fragment = project_dir / "src" / "targets" / "1.json"
+    if not fragment.exists():
+        # "scripts" layout
+        fragment = project_dir / "src" / "targets" / "1" / "target.json"
+    data = jsoncodec.loads(fragment.read_bytes())
+    data["x"] = n
+    tmp = fragment.with_suffix(".json.tmp")
+    tmp.write_text(jsoncodec.dumps(data, indent=True), encoding="utf-8")
+    os.replace(tmp, fragment)
+
+
+class BackendHarness:
+    """
+    Imports backend.py once and drives it through Flask's test client.
+    """
+
+    def __init__(self, project_dir):
+        cwd = os.getcwd()
+        try:
+            os.chdir(ROOT)
+            import backend
+            # From here on, print() goes to backend's log file; the bench uses log()
+            backend.setup_logging()
+        except ImportError as e:
+            raise Skipped(f"backend.py can't be imported here: {e}")
+        finally:
+            os.chdir(cwd)
+
+        self.backend = backend
+        self.client = backend.app.test_client()
+        # Opening the project starts its watcher too
+        self.session = backend.sessions.open(str(project_dir))
+        self.watching = False
+
+    def get_info(self):
+        response = self.client.get("/cmd/getInfo", query_string={"project": self.session.id})
+        assert response.status_code == 200, response.status_code
+        return response.get_json()
+
+    def start_watcher(self):
+        if self.watching:
+            return
+        self.watching = True
+        # Let it open its watches before anything changes
+        time.sleep(2)
+
+    def close(self):
+        self.backend.sessions.close(self.session.id)
+        # The watcher notices within a second
+        time.sleep(2)
+
+    def save_reload(self, project_dir, n, timeout=600):
+        """
+        Fragment edit -> watcher -> rebuild -> reload event -> editor fetches the .sb3.
+        """
+        bus = self.session.event_bus
+        seq = bus.latest
+        edit_fragment(project_dir, n)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            events = bus.since(seq, timeout=1)
+            if events:
+                seq = events[-1]["seq"]
+            if any(e["type"] == "reload" for e in events):
+                break
+        else:
+            raise TimeoutError("No reload event after the edit")
+        response = self.client.get("/cmd/project.sb3", query_string={"project": self.session.id})
+        assert response.status_code == 200, response.status_code
+        return len(response.get_data())
+
+
+def run(tier, params, repeat, only, workdir, layout="flat"):
+    sb3_path = workdir / "input.sb3"
+    project_dir = workdir / "project"
+    results = {}
+
+    def stage(name, fn, setup=None, times=None):
+        if only and name not in only:
+            return
+        log(f"[ bench ] {name}...")
+        try:
+            results[name] = measure(fn, times or repeat, setup)
+            log(f"[ bench ] {name}: best {results[name]['best']:.3f}s, median {results[name]['median']:.3f}s")
+        except Skipped as e:
+            results[name] = {"skipped": str(e)}
+            log(f"[ bench ] {name}: skipped ({e})")
+
+    started = time.perf_counter()
+    totals = generate_sb3(sb3_path, **params)
+    generated = time.perf_counter() - started
+    log(f"[ bench ] generated {tier} project in {generated:.1f}s: {totals}")
+
+    def fresh_project():
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+    stage("organize_sb3", lambda: organize_sb3(sb3_path, project_dir, progress=None, layout=layout),
+          setup=fresh_project)
+    if not project_dir.exists():
+        organize_sb3(sb3_path, project_dir, progress=None, layout=layout)
+    totals["src_entries"] = count_entries(project_dir / "src")
+    log(f"[ bench ] {layout} layout: {totals['src_entries']} files and folders in src/")
+
+    stage("rebuild_json", lambda: quietly(rebuild_json, str(project_dir / "src")))
+
+    def cold():
+        shutil.rmtree(project_dir / "_bvcache", ignore_errors=True)
+        project_dir.with_suffix(".sb3").unlink(missing_ok=True)
+
+    stage("rebuild_sb3_cold", lambda: rebuild_sb3(project_dir, progress=None), setup=cold)
+    if not only or "rebuild_sb3_rss" in only:
+        # A cold rebuild in a fresh process, so nothing else the bench did counts
+        log("[ bench ] rebuild_sb3_rss...")
+        try:
+            cold()
+            results["rebuild_sb3_rss"] = {"peak_rss_mb": peak_rss("sb3rebuild.py", str(project_dir))}
+            log(f"[ bench ] rebuild_sb3_rss: peak {results['rebuild_sb3_rss']['peak_rss_mb']:.1f} MB")
+        except Skipped as e:
+            results["rebuild_sb3_rss"] = {"skipped": str(e)}
+            log(f"[ bench ] rebuild_sb3_rss: skipped ({e})")
+    cache = FragmentCache(str(project_dir / "_bvcache" / "fragments.cache"))
+    rebuild_sb3(project_dir, progress=None, cache=cache)
+    stage("rebuild_sb3_warm", lambda: rebuild_sb3(project_dir, progress=None, cache=cache))
+    edits = iter(range(1, 1 << 30))
+    stage("rebuild_sb3_edit", lambda: rebuild_sb3(project_dir, progress=None, cache=cache),
+          setup=lambda: edit_fragment(project_dir, next(edits)))
+    stage("snapshot_dir", lambda: snapshot_dir(str(project_dir)))
+    stage("sync_sb3", lambda: sync_sb3(project_dir.with_suffix(".sb3"), project_dir, progress=None))
+
+    harness = None
+
+    def backend():
+        nonlocal harness
+        if harness is None:
+            init_git(project_dir, progress=None)
+            harness = BackendHarness(project_dir)
+        return harness
+
+    def invalidate():
+        backend().backend.git_cache.invalidate(str(project_dir))
+
+    stage("getInfo_cold", lambda: backend().get_info(), setup=invalidate)
+    stage("getInfo_warm", lambda: backend().get_info(), setup=lambda: backend().get_info())
+    stage("save_reload", lambda: backend().save_reload(project_dir, next(edits)),
+          setup=lambda: backend().start_watcher())
+    if harness:
+        harness.close()
+
+    return totals, generated, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark BlockVine on a synthetic project.")
+    parser.add_argument("--tier", choices=TIERS, default="small")
+    for name in ("sprites", "blocks", "list-size", "assets", "asset-kb"):
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, help="runs per stage (default 3, 1 for huge)")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--layout", choices=LAYOUTS, default="flat", help="fragment layout of the project")
+    parser.add_argument("--out", help="results file (default bench/results/<tier>-<commit>.json)")
+    parser.add_argument("--workdir", help="where the project is generated (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="don't delete the generated project")
+    args = parser.parse_args()
+
+    params = tier_params(args.tier, sprites=args.sprites, blocks=args.blocks, list_size=args.list_size,
+                         assets=args.assets, asset_kb=args.asset_kb)
+    params["seed"] = args.seed
+    repeat = args.repeat or (1 if args.tier == "huge" else 3)
+    only = set(args.only.split(",")) if args.only else None
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="blockvine-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        totals, generated, results = run(args.tier, params, repeat, only, workdir, args.layout)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    sha, dirty = git_commit()
+    report = {
+        "commit": sha,
+        "dirty": dirty,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": jsoncodec.backend,
+        "tier": args.tier,
+        "layout": args.layout,
+        "params": params,
+        "repeat": repeat,
+        "project": totals,
+        "generate_seconds": generated,
+        "results": results,
+    }
+    suffix = "" if args.layout == "flat" else f"-{args.layout}"
+    out = Path(args.out) if args.out else BENCH_DIR / "results" / f"{args.tier}{suffix}-{(sha or 'nogit')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    log(f"[ OK ] Results written to {out}")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Times a headless backend start in fresh processes: importing backend.py, then
+backend.startup(headless=True). Also lists the slowest imports (from
+`python -X importtime`) and fails if the GUI stack got loaded anyway.
+
+    python bench/startup.py [--repeat N] [--top N] [--max-ms MS] [--out results.json]
+
+The child runs with HOME and TMPDIR pointed at a temp dir, so startup() doesn't
+touch the real ~/BlockVine or the running app's state file.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+
+OUT = sys.stdout
+
+GUI_MODULES = ("tkinter", "pystray", "PIL")
+
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+import backend
+imported = time.perf_counter()
+backend.startup(headless=True)
+done = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "startup": done - imported,
+    "gui_loaded": [m for m in %r if m in sys.modules],
+}), file=sys.__stdout__)
+""" % (GUI_MODULES,)
+
+
+def log(message):
+    print(message, file=OUT, flush=True)
+
+
+def run_child(env, *python_args):
+    return subprocess.run([sys.executable, *python_args, "-c", CHILD], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def slowest_imports(stderr, top):
+    """
+    backend's direct imports from -X importtime output, slowest (cumulative) first.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        # backend is imported at depth 0, what it imports itself at depth 1
+        if name.startswith("   ") or not name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a headless BlockVine backend start.")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median start takes longer")
+    parser.add_argument("--out", help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="blockvine-startup-") as home:
+        env = {**os.environ, "HOME": home, "USERPROFILE": home, "TMPDIR": home, "TEMP": home, "TMP": home}
+        runs = [json.loads(run_child(env).stdout) for _ in range(args.repeat)]
+        traced = run_child(env, "-X", "importtime")
+
+    totals = [run["import"] + run["startup"] for run in runs]
+    results = {
+        "import_ms": statistics.median(run["import"] for run in runs) * 1000,
+        "startup_ms": statistics.median(run["startup"] for run in runs) * 1000,
+        "total_ms": statistics.median(totals) * 1000,
+        "best_ms": min(totals) * 1000,
+        "gui_loaded": sorted({m for run in runs for m in run["gui_loaded"]}),
+        "slowest_imports_ms": dict(slowest_imports(traced.stderr, args.top)),
+    }
+
+    log(f"[ bench ] headless start: {results['total_ms']:.0f}ms median, {results['best_ms']:.0f}ms best "
+        f"(import {results['import_ms']:.0f}ms, startup() {results['startup_ms']:.1f}ms)")
+    for name, ms in results["slowest_imports_ms"].items():
+        log(f"[ bench ]   {name:<24}{ms:>8.1f}ms")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        log(f"[ OK ] Results written to {args.out}")
+
+    failed = False
+    if results["gui_loaded"]:
+        log(f"[ ERROR ] Headless start loaded {', '.join(results['gui_loaded'])}")
+        failed = True
+    if args.max_ms and results["total_ms"] > args.max_ms:
+        log(f"[ ERROR ] Median start {results['total_ms']:.0f}ms is over the {args.max_ms:g}ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
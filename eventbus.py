@@ -0,0 +1,57 @@
+import collections
+import os
+import threading
+import time
+
+
+class EventBus:
+    """
+    Thread-safe in-memory event log with monotonically increasing sequence numbers.
+    Readers ask for everything after the last sequence they saw, so every client
+    gets every event, and a reconnecting client resumes where it left off.
+    """
+
+    def __init__(self, backlog=256):
+        self.events = collections.deque(maxlen=backlog)
+        self.seq = 0
+        # Sequence numbers restart with the process, so ids carry a boot tag too
+        self.boot = os.urandom(4).hex()
+        self.cond = threading.Condition()
+
+    def publish(self, kind, **data):
+        with self.cond:
+            self.seq += 1
+            self.events.append({"seq": self.seq, "type": kind, "time": time.time(), **data})
+            self.cond.notify_all()
+            return self.seq
+
+    @property
+    def latest(self):
+        with self.cond:
+            return self.seq
+
+    def event_id(self, seq):
+        return f"{self.boot}:{seq}"
+
+    def parse_id(self, event_id):
+        """
+        Turns a client's Last-Event-ID back into a sequence number.
+        Returns None if it doesn't belong to this process (or there is none).
+        """
+        boot, _, seq = (event_id or "").partition(":")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, seq, timeout=None):
+        """
+        Returns the events newer than `seq`, waiting up to `timeout` seconds for
+        one to arrive. If some of them already fell out of the backlog, a
+        "resync" event comes first so the client knows to reload everything.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > seq, timeout)
+            events = [e for e in self.events if e["seq"] > seq]
+            if events and events[0]["seq"] > seq + 1:
+                events.insert(0, {"seq": events[0]["seq"] - 1, "type": "resync", "time": time.time()})
+            return events
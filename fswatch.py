@@ -0,0 +1,338 @@
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import pickle
+import select
+import stat as statmod
+import struct
+import sys
+import threading
+import time
+
+import metrics
+
+IGNORED_DIRS = {"__pycache__", "_bvcache", ".git"}
+IGNORED_SUFFIXES = {".pyc", ".tmp"}
+
+
+def is_ignored(path, root):
+    parts = os.path.relpath(path, root).split(os.sep)
+    return any(p in IGNORED_DIRS for p in parts) or path.endswith(tuple(IGNORED_SUFFIXES))
+
+
+def snapshot_dir(root, include_dirs=False):
+    """
+    Maps every watched file under root to its (mtime, size).
+    With include_dirs, the folders below root are in there as well.
+    """
+    snap = {}
+
+    for base, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+
+        for name in files + (dirs if include_dirs else []):
+            if name.endswith(tuple(IGNORED_SUFFIXES)):
+                continue
+
+            path = os.path.join(base, name)
+            try:
+                stat = os.stat(path)
+                snap[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+
+    return snap
+
+
+def snapshot_file(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ContentIndex:
+    """
+    Persistent map of every file's content digest (BLAKE2b) as it was last seen,
+    so changes that leave a file's bytes as they were (a touch, a checkout back to
+    the same content, a rewrite with identical JSON) can be told apart from real
+    edits. A file is only re-hashed when its mtime or size moved.
+    """
+
+    def __init__(self, index_file=None):
+        self.index_file = index_file
+        # path -> (mtime_ns, size, digest)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hashed = 0
+        self.dirty = False
+
+        if index_file and os.path.isfile(index_file):
+            try:
+                with open(index_file, "rb") as f:
+                    self.entries = pickle.load(f)
+            except Exception:
+                self.entries = {}
+
+    @staticmethod
+    def _digest(path):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        return digest.digest()
+
+    def changed(self, path):
+        """
+        Whether path's content differs from when it was last seen, and remembers it
+        as seen now. Deleted files and anything that isn't a regular file (folders)
+        always count as changed.
+        """
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            with self.lock:
+                self.dirty = self.entries.pop(path, None) is not None or self.dirty
+            return True
+        if not statmod.S_ISREG(stat.st_mode):
+            return True
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                return False
+            try:
+                digest = self._digest(path)
+            except OSError:
+                return True
+            self.hashed += 1
+            self.entries[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            self.dirty = True
+            return entry is None or entry[2] != digest
+
+    def refresh(self, paths, prune=False):
+        """
+        Records the current content of paths. With `prune`, entries for any other
+        path are dropped, so paths should then be every file of the project.
+        """
+        paths = set(paths)
+        for path in paths:
+            self.changed(path)
+        if prune:
+            with self.lock:
+                for path in self.entries.keys() - paths:
+                    del self.entries[path]
+                    self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.index_file or not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            tmp_file = f"{self.index_file}.tmp"
+            with open(tmp_file, "wb") as f:
+                pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.index_file)
+            self.dirty = False
+
+
+class PollingWatcher:
+    """
+    Portable fallback: rescans the project every `interval` seconds and diffs
+    the result against the previous scan.
+    """
+
+    def __init__(self, proj_dir, sb3_path, interval=1.0):
+        self.proj_dir = proj_dir
+        self.sb3_path = sb3_path
+        self.interval = interval
+        self.pending = set()
+        self.last_dir = snapshot_dir(proj_dir)
+        self.last_sb3 = snapshot_file(sb3_path)
+
+    def _scan(self):
+        changed = set()
+        with metrics.span("watcher.snapshot"):
+            dir_snap = snapshot_dir(self.proj_dir)
+            sb3_snap = snapshot_file(self.sb3_path)
+
+        for path in dir_snap.keys() | self.last_dir.keys():
+            if dir_snap.get(path) != self.last_dir.get(path):
+                changed.add(path)
+        if sb3_snap != self.last_sb3:
+            changed.add(self.sb3_path)
+
+        self.last_dir = dir_snap
+        self.last_sb3 = sb3_snap
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Returns the set of paths that changed since the last call.
+        """
+        if not self.pending:
+            time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+            self.pending |= self._scan()
+        changed, self.pending = self.pending, set()
+        return changed
+
+    def close(self):
+        pass
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Linux watcher built on inotify through ctypes. Every directory of the project
+    gets its own watch, and the .sb3 is watched through its parent directory
+    so editors that save by renaming a temp file are still picked up.
+    """
+
+    def __init__(self, proj_dir, sb3_path):
+        self.proj_dir = proj_dir
+        self.sb3_path = sb3_path
+        self.sb3_dir, self.sb3_name = os.path.split(sb3_path)
+        self.wds = {}
+        self.pending = set()
+        self.last_sb3 = snapshot_file(sb3_path)
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        try:
+            self._watch(self.sb3_dir)
+            self._watch_tree(proj_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch({path}): {os.strerror(err)}")
+        self.wds[wd] = path
+
+    def _watch_tree(self, root):
+        """
+        Adds watches for root and its subdirectories, and returns the files
+        found there (they may have been written before the watch existed).
+        """
+        found = set()
+        with metrics.span("watcher.snapshot"):
+            for base, dirs, files in os.walk(root):
+                dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+                self._watch(base)
+                found.update(os.path.join(base, name) for name in files)
+        return {p for p in found if not is_ignored(p, self.proj_dir)}
+
+    def _read_events(self, timeout):
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b"\0")
+                offset += length
+                changed |= self._handle_event(wd, mask, os.fsdecode(name))
+                metrics.inc("watcher_events")
+
+        return changed
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped, so we can't know what changed; assume the tree did,
+            # and only report the .sb3 if its stat says so.
+            changed = {self.proj_dir}
+            if snapshot_file(self.sb3_path) != self.last_sb3:
+                changed.add(self.sb3_path)
+            return changed
+
+        base = self.wds.get(wd)
+        if base is None:
+            return set()
+        if mask & IN_IGNORED:
+            del self.wds[wd]
+            return set()
+
+        if base == self.sb3_dir:
+            if name == self.sb3_name:
+                return {self.sb3_path}
+            return set()
+
+        path = os.path.join(base, name) if name else base
+        if is_ignored(path, self.proj_dir):
+            return set()
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            try:
+                return {path} | self._watch_tree(path)
+            except OSError as e:
+                print(f"[Watcher] Could not watch {path}: {e}")
+        return {path}
+
+    def wait(self, timeout=None):
+        """
+        Blocks until something changes (or timeout runs out) and returns the
+        changed paths.
+        """
+        if not self.pending:
+            self.pending |= self._read_events(timeout)
+        changed, self.pending = self.pending, set()
+        if self.sb3_path in changed:
+            self.last_sb3 = snapshot_file(self.sb3_path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def open_watcher(proj_dir, sb3_path):
+    """
+    Uses inotify where it is available, and falls back to polling otherwise.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(proj_dir, sb3_path)
+        except (OSError, AttributeError) as e:
+            print(f"[Watcher] inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(proj_dir, sb3_path)
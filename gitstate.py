@@ -0,0 +1,586 @@
+import heapq
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import metrics
+
+counters = {"subprocesses": 0}
+counters_lock = threading.Lock()
+
+
+def run_git(proj_dir, *args, **kwargs):
+    """
+    subprocess.run for `git -C proj_dir ...`, counted in counters["subprocesses"].
+    """
+    with counters_lock:
+        counters["subprocesses"] += 1
+    with metrics.span("git", command=_subcommand(args)):
+        return subprocess.run(["git", "-C", proj_dir, *args], **kwargs)
+
+
+def _subcommand(args):
+    """
+    "status" for ("--no-optional-locks", "-c", "core.fsmonitor=true", "status", ...).
+    """
+    args = iter(args)
+    for arg in args:
+        if arg == "-c":
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return "git"
+
+
+def find_git_dirs(proj_dir):
+    """
+    Returns (git_dir, common_dir) for a worktree, or (None, None) if it has no .git.
+    Linked worktrees keep HEAD/index in git_dir but share refs through common_dir.
+    """
+    dot_git = os.path.join(proj_dir, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git, dot_git
+    if not os.path.isfile(dot_git):
+        return None, None
+
+    with open(dot_git, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if not content.startswith("gitdir:"):
+        return None, None
+    git_dir = os.path.normpath(os.path.join(proj_dir, content[len("gitdir:"):].strip()))
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, "r", encoding="utf-8") as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir, common_dir
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def repo_signature(proj_dir):
+    """
+    Cheap fingerprint of the repository state: HEAD, index, packed-refs and
+    every loose ref. Any commit, stage, checkout or fetch changes it.
+    """
+    git_dir, common_dir = find_git_dirs(proj_dir)
+    if git_dir is None:
+        return None
+
+    sig = [
+        _stat_key(os.path.join(git_dir, "HEAD")),
+        _stat_key(os.path.join(git_dir, "index")),
+        _stat_key(os.path.join(common_dir, "packed-refs")),
+    ]
+    for base, dirs, files in os.walk(os.path.join(common_dir, "refs")):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(base, name)
+            sig.append((path, _stat_key(path)))
+    return tuple(sig)
+
+
+_git_version = None
+
+
+def git_version():
+    global _git_version
+    if _git_version is None:
+        try:
+            with counters_lock:
+                counters["subprocesses"] += 1
+            out = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout
+            _git_version = tuple(int(p) for p in out.split()[2].split(".")[:2])
+        except (OSError, IndexError, ValueError):
+            _git_version = (0, 0)
+    return _git_version
+
+
+def status_config():
+    """
+    -c options that make status cheaper on big worktrees where git supports them.
+    The builtin fsmonitor daemon only exists on macOS and Windows. Both caches
+    live in index extensions, which only a status that may write the index adds.
+    """
+    opts = ["-c", "core.untrackedCache=true"]
+    if sys.platform in ("darwin", "win32") and git_version() >= (2, 37):
+        opts += ["-c", "core.fsmonitor=true"]
+    return opts
+
+
+def parse_status_v2(out):
+    """
+    Parses `git status --porcelain=v2 --branch -z` into branch info plus
+    porcelain v1 style "XY path" lines, which is what the GUI displays.
+    """
+    info = {"oid": None, "branch": None, "upstream": None, "ahead": 0, "behind": 0}
+    changes = []
+
+    records = out.split("\0")
+    i = 0
+    while i < len(records):
+        rec = records[i]
+        i += 1
+        if not rec:
+            continue
+
+        if rec.startswith("# "):
+            key, _, value = rec[2:].partition(" ")
+            if key == "branch.oid":
+                info["oid"] = None if value == "(initial)" else value
+            elif key == "branch.head":
+                info["branch"] = None if value == "(detached)" else value
+            elif key == "branch.upstream":
+                info["upstream"] = value
+            elif key == "branch.ab":
+                ahead, behind = value.split()
+                info["ahead"], info["behind"] = int(ahead), -int(behind)
+
+        elif rec[0] == "1":
+            fields = rec.split(" ", 8)
+            changes.append(f"{fields[1].replace('.', ' ')} {fields[8]}")
+
+        elif rec[0] == "2":
+            fields = rec.split(" ", 9)
+            # Renames are followed by a separate record holding the original path
+            orig = records[i]
+            i += 1
+            changes.append(f"{fields[1].replace('.', ' ')} {orig} -> {fields[9]}")
+
+        elif rec[0] == "u":
+            fields = rec.split(" ", 10)
+            changes.append(f"{fields[1]} {fields[10]}")
+
+        elif rec[0] == "?":
+            changes.append(f"?? {rec[2:]}")
+
+    return info, changes
+
+
+def _short_date(timestamp, offset):
+    sign = -1 if offset.startswith("-") else 1
+    tz = timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5])))
+    return datetime.fromtimestamp(int(timestamp), tz).strftime("%Y-%m-%d")
+
+
+def parse_commit(oid, raw):
+    """
+    Parses a raw commit object into the fields the history pane shows.
+    """
+    header, _, message = raw.partition(b"\n\n")
+    parents = []
+    author = ("", "0", "+0000")
+    commit_time = 0
+
+    for line in header.split(b"\n"):
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode())
+        elif line.startswith(b"author "):
+            name_email, _, when = line[7:].decode("utf-8", "replace").rpartition("> ")
+            timestamp, tz = when.split()
+            author = (name_email.partition(" <")[0], timestamp, tz)
+        elif line.startswith(b"committer "):
+            commit_time = int(line.rsplit(b" ", 2)[1])
+
+    # Same as %s: the first paragraph of the message, joined into one line
+    subject = " ".join(message.decode("utf-8", "replace").split("\n\n", 1)[0].split("\n")).strip()
+    return {
+        "oid": oid,
+        "parents": parents,
+        "time": commit_time,
+        "hash": oid[:7],
+        "author": author[0],
+        "date": _short_date(author[1], author[2]),
+        "message": subject,
+    }
+
+
+class CatFile:
+    """
+    Long-lived `git cat-file --batch` process, so reading objects doesn't
+    cost a process per query. Not thread-safe; GitRepo only uses it from its worker.
+    """
+
+    def __init__(self, proj_dir):
+        self.proj_dir = proj_dir
+        self.proc = None
+
+    def _ensure(self):
+        if self.proc is None or self.proc.poll() is not None:
+            with counters_lock:
+                counters["subprocesses"] += 1
+            self.proc = subprocess.Popen(
+                ["git", "-C", self.proj_dir, "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        return self.proc
+
+    def read(self, oid):
+        """
+        Returns (type, content) of an object, or None if it doesn't exist.
+        """
+        with metrics.span("git.cat_file"):
+            return self._read(oid)
+
+    def _read(self, oid):
+        proc = self._ensure()
+        proc.stdin.write(f"{oid}\n".encode())
+        proc.stdin.flush()
+
+        header = proc.stdout.readline().decode().split()
+        if len(header) != 3:
+            if not header:
+                self.close()
+            return None
+        _, obj_type, size = header
+        content = proc.stdout.read(int(size))
+        proc.stdout.read(1)
+        return obj_type, content
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+            self.proc = None
+
+
+class HistoryWalk:
+    """
+    One branch's history, newest first like `git log`, loaded only as far as it
+    has been asked for. The walk's frontier is kept, so the next page carries on
+    where the last one stopped, and a fast-forward only has to read the commits
+    it added (see advance()).
+    """
+
+    def __init__(self, head, read):
+        # read(oid) -> parse_commit() dict, or None
+        self.head = head
+        self.read = read
+        self.commits = []
+        # oid -> position in commits
+        self.index = {}
+        self.queue = []
+        self.seen = {head}
+        self.pushed = 0
+        self._push(read(head))
+
+    def _push(self, commit):
+        if commit:
+            self.pushed += 1
+            heapq.heappush(self.queue, (-commit["time"], self.pushed, commit))
+
+    def _step(self):
+        _, _, commit = heapq.heappop(self.queue)
+        self.index[commit["oid"]] = len(self.commits)
+        self.commits.append(commit)
+        for parent in commit["parents"]:
+            if parent not in self.seen:
+                self.seen.add(parent)
+                self._push(self.read(parent))
+
+    def advance(self, head, oids):
+        """
+        Moves the walk to head, which has the current head as an ancestor.
+        oids are the commits in between, i.e. `git rev-list <old head>..<head>`.
+        """
+        self.seen.update(oids)
+        # rev-list lists them in log order; sorted() keeps that order for equal times
+        commits = sorted(filter(None, map(self.read, oids)), key=lambda c: -c["time"])
+        # Commits older than what's loaded (from a merged branch) wait in the queue
+        tail = self.commits[-1]["time"] if self.commits and self.queue else None
+        newer = [c for c in commits if tail is None or c["time"] >= tail]
+        for commit in commits[len(newer):]:
+            self._push(commit)
+        # On equal times the new commits go first, they descend from the old ones
+        self.commits = list(heapq.merge(newer, self.commits, key=lambda c: -c["time"]))
+        self.index = {commit["oid"]: i for i, commit in enumerate(self.commits)}
+        self.head = head
+
+    def page(self, cursor=None, limit=32):
+        """
+        Up to `limit` commits after the one with oid `cursor` (from the start without
+        one), plus the cursor for the page after, or None if this was the last.
+        Raises LookupError if cursor isn't part of this history.
+        """
+        if cursor is not None:
+            while cursor not in self.index and self.queue:
+                self._step()
+            if cursor not in self.index:
+                raise LookupError(f"{cursor} is not in the history of {self.head}")
+        start = 0 if cursor is None else self.index[cursor] + 1
+        # One more than the page, to know whether there is a next one
+        while len(self.commits) <= start + limit and self.queue:
+            self._step()
+        commits = self.commits[start:start + limit]
+        more = len(self.commits) > start + limit
+        return commits, commits[-1]["oid"] if more else None
+
+
+class GitRepo:
+    """
+    Git backend for one project. Every query and command runs on the repo's own
+    worker thread rather than the request thread, status comes from a single
+    `status --porcelain=v2 --branch` call, branches are read from the refs
+    directly, and commits are read through a persistent cat-file process.
+    History is kept per branch in a HistoryWalk, so it's only walked once.
+    """
+
+    def __init__(self, proj_dir):
+        self.proj_dir = proj_dir
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blockvine-git")
+        self.cat_file = CatFile(proj_dir)
+        # branch (or commit, when detached) -> HistoryWalk
+        self.histories = {}
+        self.caches_saved = False
+
+    def call(self, fn, *args, **kwargs):
+        return self.worker.submit(fn, *args, **kwargs).result()
+
+    def _branches(self):
+        git_dir, common_dir = find_git_dirs(self.proj_dir)
+        refs = set()
+
+        packed = os.path.join(common_dir, "packed-refs")
+        if os.path.isfile(packed):
+            with open(packed, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+                    parts = line.split()
+                    if len(parts) == 2:
+                        refs.add(parts[1])
+
+        for base, _, files in os.walk(os.path.join(common_dir, "refs")):
+            for name in files:
+                refs.add(os.path.relpath(os.path.join(base, name), common_dir).replace(os.sep, "/"))
+
+        # Same names and order as `git branch -a --format %(refname:short)`
+        branches = []
+        for ref in sorted(refs):
+            if ref.startswith("refs/heads/"):
+                branches.append(ref[len("refs/heads/"):])
+            elif ref.startswith("refs/remotes/"):
+                branches.append(ref[len("refs/remotes/"):])
+        return branches
+
+    def _status(self):
+        # The first status may refresh the index, which is when git stores the
+        # untracked/fsmonitor caches in it; after that, status never takes its lock
+        locks = [] if not self.caches_saved else ["--no-optional-locks"]
+        self.caches_saved = True
+        out = run_git(
+            self.proj_dir, *locks, *status_config(),
+            "status", "--porcelain=v2", "--branch", "-z",
+            capture_output=True, text=True, check=True
+        ).stdout
+        return parse_status_v2(out)
+
+    def _read_commit(self, oid):
+        obj = self.cat_file.read(oid)
+        return parse_commit(oid, obj[1]) if obj and obj[0] == "commit" else None
+
+    def _walk(self, branch, head):
+        walk = self.histories.get(branch)
+        if walk is not None and walk.head != head:
+            commit = self._read_commit(head)
+            if commit and commit["parents"] == [walk.head]:
+                # One plain commit on top, the usual case, needs no git process
+                walk.advance(head, [head])
+            elif run_git(self.proj_dir, "merge-base", "--is-ancestor", walk.head, head,
+                         capture_output=True).returncode == 0:
+                oids = run_git(self.proj_dir, "rev-list", f"{walk.head}..{head}",
+                               capture_output=True, text=True, check=True).stdout.split()
+                walk.advance(head, oids)
+            else:
+                # Rewound, reset or rewritten: start over
+                walk = None
+        if walk is None:
+            walk = self.histories[branch] = HistoryWalk(head, self._read_commit)
+        return walk
+
+    def _history(self, branch, head, cursor=None, limit=32):
+        """
+        A page of branch's history (whose tip is head) and the cursor of the next one.
+        """
+        if not head:
+            return [], None
+        commits, next_cursor = self._walk(branch or head, head).page(cursor, limit)
+        return [{k: c[k] for k in ("oid", "hash", "author", "date", "message")} for c in commits], next_cursor
+
+    def _snapshot(self):
+        if find_git_dirs(self.proj_dir)[0] is None:
+            return empty_state()
+        try:
+            info, unstaged = self._status()
+        except subprocess.CalledProcessError:
+            return empty_state()
+        history, history_next = self._history(info["branch"], info["oid"])
+        return {
+            "branches": self._branches(),
+            "unstaged": unstaged,
+            "history": history,
+            "history_next": history_next,
+            "head": info["oid"],
+            "branch": info["branch"],
+            "upstream": info["upstream"],
+            "ahead": info["ahead"],
+            "behind": info["behind"],
+        }
+
+    def snapshot(self):
+        """
+        Branches, status, ahead/behind and recent history in one go.
+        """
+        with metrics.span("git.snapshot"):
+            return self.call(self._snapshot)
+
+    def history(self, branch, head, cursor=None, limit=32):
+        """
+        (commits, next cursor) of branch, see HistoryWalk.page().
+        """
+        with metrics.span("git.history"):
+            return self.call(self._history, branch, head, cursor, limit)
+
+    def _resolve(self, rev):
+        if rev.startswith("-"):
+            return None
+        result = run_git(self.proj_dir, "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}",
+                         capture_output=True, text=True)
+        return result.stdout.strip() or None
+
+    def resolve(self, rev):
+        """
+        The commit a branch (or any revision) points at, None if there's no such thing.
+        """
+        return self.call(self._resolve, rev)
+
+    def _run(self, *args):
+        return run_git(self.proj_dir, *args, check=True, capture_output=True, text=True)
+
+    def stage(self, file):
+        return self.call(self._run, "add", file)
+
+    def unstage(self, file):
+        return self.call(self._run, "restore", "--staged", file)
+
+    def commit(self, message):
+        return self.call(self._run, "commit", "-m", message)
+
+    def checkout(self, branch):
+        return self.call(self._run, "checkout", branch)
+
+    def close(self):
+        self.worker.submit(self.cat_file.close)
+        self.worker.shutdown(wait=False)
+
+
+def empty_state():
+    return {"branches": [], "unstaged": [], "history": [], "history_next": None, "head": None,
+            "branch": None, "upstream": None, "ahead": 0, "behind": 0}
+
+
+class GitStateCache:
+    """
+    Remembers each project's GitRepo and its last snapshot. A snapshot is reused
+    until the repository signature changes, or until invalidate() is called
+    because the watcher saw the worktree change. Lookups that miss at the same
+    time share one snapshot, so a dozen polling tabs cost one `git status`.
+    """
+
+    def __init__(self):
+        self.repos = {}
+        self.entries = {}
+        self.generations = {}
+        # proj_dir -> ((sig, gen), Future) of the snapshot being taken right now
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def repo(self, proj_dir):
+        with self.lock:
+            repo = self.repos.get(proj_dir)
+            if repo is None:
+                repo = self.repos[proj_dir] = GitRepo(proj_dir)
+            return repo
+
+    def get(self, proj_dir):
+        """
+        Returns the snapshot dict for proj_dir (see GitRepo.snapshot).
+        """
+        sig = repo_signature(proj_dir)
+        with self.lock:
+            gen = self.generations.get(proj_dir, 0)
+            entry = self.entries.get(proj_dir)
+            if entry and entry["sig"] == sig and entry["gen"] == gen:
+                self.hits += 1
+                return entry["state"]
+            self.misses += 1
+
+            flight = self.inflight.get(proj_dir)
+            if flight and flight[0] == (sig, gen):
+                # Started after the same change we saw, so it's as fresh as ours would be
+                self.shared += 1
+                future = flight[1]
+            else:
+                future = Future()
+                self.inflight[proj_dir] = ((sig, gen), future)
+                flight = None
+        if flight:
+            return future.result()
+
+        try:
+            state = empty_state() if sig is None else self.repo(proj_dir).snapshot()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                if self.inflight.get(proj_dir, (None, None))[1] is future:
+                    del self.inflight[proj_dir]
+                if not future.done():
+                    # Tagged with the generation we started from, so an invalidate()
+                    # that raced with this lookup still forces the next one to refresh
+                    self.entries[proj_dir] = {"sig": sig, "gen": gen, "state": state}
+        future.set_result(state)
+        return state
+
+    def invalidate(self, proj_dir):
+        with self.lock:
+            self.generations[proj_dir] = self.generations.get(proj_dir, 0) + 1
+
+    def forget(self, proj_dir):
+        """
+        Drops everything cached for proj_dir and stops its git processes.
+        """
+        with self.lock:
+            repo = self.repos.pop(proj_dir, None)
+            self.entries.pop(proj_dir, None)
+            self.generations.pop(proj_dir, None)
+        if repo:
+            repo.close()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "subprocesses": counters["subprocesses"],
+            }
@@ -1,13 +1,120 @@
-import json, os
+import os, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
-def disassemble_json(data, path, *, split_arrays=True):
+import jsoncodec
+
+# "flat": every target is one targets/N.json.
+# "scripts": every target is a targets/N/ folder with target.json, and its blocks
+# split into scripts/<top block id>.json, one per top-level script.
+LAYOUTS = ("flat", "scripts")
+# Project manifest next to src/, records which layout the project uses
+MANIFEST = "blockvine.json"
+
+def read_layout(project_dir):
+    """
+    The layout recorded in a project's manifest; "flat" if it has none.
+    """
+    try:
+        with open(os.path.join(project_dir, MANIFEST), "rb") as f:
+            layout = jsoncodec.loads(f.read()).get("layout", "flat")
+    except FileNotFoundError:
+        return "flat"
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown fragment layout in {MANIFEST}: {layout}")
+    return layout
+
+def write_manifest(project_dir, layout):
+    """
+    Records the layout in the project's manifest. A flat project gets no manifest.
+    """
+    manifest = os.path.join(project_dir, MANIFEST)
+    if layout == "flat":
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        return
+    writer = FragmentWriter(max_workers=1)
+    writer.add(manifest, {"layout": layout})
+    writer.flush()
+
+def disassemble_json(data, path, *, split_arrays=True, prune=False, writer=None, layout="flat"):
     """
     This recursively disassembles JSON data into files/folders.
     It only splits direct (parent) arrays as individual JSONs.
     Nested arrays inside dicts are kept inline in index.json.
+    With the "scripts" layout, targets are further split by script (see LAYOUTS).
+    Files whose content wouldn't change are left untouched. With `prune`,
+    anything under `path` that the data no longer produces is deleted.
+    Returns the writer's stats: written/skipped/deleted counts and bytes_written.
     """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown fragment layout: {layout}")
+    writer = writer or FragmentWriter()
+    expected = set()
+    _disassemble(data, path, split_arrays, expected, writer, layout)
+    writer.flush()
+    if prune:
+        writer.stats["deleted"] += prune_tree(path, expected)
+    return writer.stats
+
+class FragmentWriter:
+    """
+    Serializes fragments in memory and writes only the ones whose bytes differ
+    from what's on disk (size first, then content), across a bounded thread pool.
+    Each write goes to a .tmp file that is renamed into place, so readers like the
+    watcher or jsonrebuild never see half a fragment.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self.pending = []
+        self.stats = {"written": 0, "skipped": 0, "deleted": 0, "bytes_written": 0}
+        self.lock = threading.Lock()
+
+    def add(self, file_path, value):
+        self.pending.append((file_path, value))
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # list() so worker exceptions surface here
+            list(pool.map(lambda job: self._write(*job), pending))
+
+    def _write(self, file_path, value):
+        text = jsoncodec.dumps(value, indent=True)
+        # Same bytes the old text-mode writes produced, on every platform
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)
+        # Non-ASCII is always escaped, so this never fails
+        data = text.encode("ascii")
+
+        if _same_bytes(file_path, data):
+            with self.lock:
+                self.stats["skipped"] += 1
+            return
+
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+        with self.lock:
+            self.stats["written"] += 1
+            self.stats["bytes_written"] += len(data)
+
+def _same_bytes(file_path, data):
+    try:
+        if os.stat(file_path).st_size != len(data):
+            return False
+        with open(file_path, "rb") as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+def _disassemble(data, path, split_arrays, expected, writer, layout="flat"):
     os.makedirs(path, exist_ok=True)
+    expected.add(path)
     plain_values = {}
 
     for key, value in data.items():
@@ -15,20 +122,93 @@ def disassemble_json(data, path, *, split_arrays=True):
 
         if isinstance(value, dict):
             subdir = os.path.join(path, encoded_key)
-            disassemble_json(value, subdir, split_arrays=True)
+            _disassemble(value, subdir, True, expected, writer, layout)
 
         elif isinstance(value, list) and split_arrays:
             list_dir = os.path.join(path, encoded_key)
             os.makedirs(list_dir, exist_ok=True)
+            expected.add(list_dir)
 
             for i, item in enumerate(value):
+                if layout == "scripts" and key == "targets" and isinstance(item, dict):
+                    _disassemble_target(item, os.path.join(list_dir, str(i)), expected, writer)
+                    continue
                 item_file = os.path.join(list_dir, f"{i}.json")
-                with open(item_file, "w", encoding="utf-8") as f:
-                    json.dump(item, f, indent=2)
+                expected.add(item_file)
+                writer.add(item_file, item)
 
         else:
             plain_values[key] = value
 
     if plain_values:
-        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
-            json.dump(plain_values, f, indent=2)
+        index_file = os.path.join(path, "index.json")
+        expected.add(index_file)
+        writer.add(index_file, plain_values)
+
+def split_scripts(blocks):
+    """
+    Groups a target's blocks by the top-level script they belong to, in the order
+    the scripts first appear. Returns {top block id: {block id: block}}.
+    """
+    roots = {}
+
+    def root_of(block_id):
+        seen = []
+        while block_id not in roots:
+            block = blocks.get(block_id)
+            parent = block.get("parent") if isinstance(block, dict) else None
+            seen.append(block_id)
+            # Broken or cyclic parent links just start a script of their own
+            if parent is None or parent not in blocks or parent in seen:
+                roots[block_id] = block_id
+                break
+            block_id = parent
+        root = roots[block_id]
+        for b in seen:
+            roots[b] = root
+        return root
+
+    scripts = {}
+    for block_id, block in blocks.items():
+        scripts.setdefault(root_of(block_id), {})[block_id] = block
+    return scripts
+
+def _disassemble_target(target, path, expected, writer):
+    """
+    Writes one target in the "scripts" layout: target.json holds everything but
+    the blocks, whose place is taken by the list of script ids in order.
+    """
+    os.makedirs(path, exist_ok=True)
+    expected.add(path)
+    scripts = split_scripts(target.get("blocks") or {})
+
+    target_file = os.path.join(path, "target.json")
+    expected.add(target_file)
+    writer.add(target_file, {k: (list(scripts) if k == "blocks" else v) for k, v in target.items()})
+
+    if scripts:
+        scripts_dir = os.path.join(path, "scripts")
+        os.makedirs(scripts_dir, exist_ok=True)
+        expected.add(scripts_dir)
+        for script_id, script in scripts.items():
+            script_file = os.path.join(scripts_dir, f"{quote(script_id, safe='')}.json")
+            expected.add(script_file)
+            writer.add(script_file, script)
+
+def prune_tree(root, expected):
+    """
+    Deletes every file and folder under root that isn't in `expected`.
+    Returns how many files were deleted.
+    """
+    deleted = 0
+    for base, dirs, files in os.walk(root, topdown=False):
+        for name in files:
+            file_path = os.path.join(base, name)
+            if file_path not in expected:
+                os.remove(file_path)
+                deleted += 1
+        for name in dirs:
+            dir_path = os.path.join(base, name)
+            if dir_path not in expected:
+                shutil.rmtree(dir_path, ignore_errors=True)
+    return deleted
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+JSON backend used by jsonbreak, jsonrebuild and sb3break.
+Uses orjson when it's installed, stdlib json otherwise. Whatever the backend,
+dumps() returns exactly what stdlib json.dumps would, so fragments on disk
+(and the git history built on them) don't change when orjson comes or goes.
+"""
+
+import contextlib
+import gc
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes some floats differently from repr(): 1e16 vs 1e+16, 0.00001 vs 1e-05.
+# These regexes start with a literal, so they scan megabytes in milliseconds.
+_EXPONENT = re.compile(rb"[eE][-+]?\d")
+_SMALL_FLOAT = re.compile(rb"0\.0000")
+_NUMBER_CHARS = frozenset(b"0123456789.-")
+# Every digit becomes 0 and everything else a space, to find long digit runs fast
+_DIGITS_ONLY = bytes(0x30 if 0x30 <= i <= 0x39 else 0x20 for i in range(256))
+# stdlib's ensure_ascii escapes everything outside space..tilde, orjson only control chars
+_NON_ASCII = re.compile("[\x7f-\U0010ffff]")
+
+
+class _NonFinite(float):
+    """
+    NaN/Infinity from the stdlib parser. orjson would write these as null,
+    but it refuses float subclasses, so dumps() falls back to stdlib for them.
+    """
+
+
+def _parse_float(text):
+    value = float(text)
+    return value if math.isfinite(value) else _NonFinite(value)
+
+
+def _float_mismatch(out):
+    """
+    True if orjson's output may hold a float that repr() would write differently.
+    Hits inside strings (block ids like "a2e4") are ruled out by looking back
+    for the start of the token; anything still ambiguous just means a fallback.
+    """
+    if _SMALL_FLOAT.search(out):
+        return True
+    for match in _EXPONENT.finditer(out):
+        i = match.start()
+        if i == 0 or out[i - 1] not in b"0123456789":
+            continue
+        while i > 0 and out[i - 1] in _NUMBER_CHARS:
+            i -= 1
+        if i == 0 or out[i - 1] in b" \n[:,":
+            return True
+    return False
+
+
+def _escape(match):
+    code = ord(match.group())
+    if code > 0xFFFF:
+        code -= 0x10000
+        return "\\u{:04x}\\u{:04x}".format(0xD800 | (code >> 10), 0xDC00 | (code & 0x3FF))
+    return "\\u{:04x}".format(code)
+
+
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """
+    Keeps the cyclic GC off while parsing a big document: it allocates millions of
+    containers, none of them garbage, and GC passes over them double the parse time.
+    Nests across threads; GC comes back on when the last caller leaves, and only
+    if it was on when the first one came in.
+    """
+    global _gc_pauses, _gc_was_enabled
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def _fallback_loads(data):
+    return json.loads(data, parse_float=_parse_float, parse_constant=_NonFinite)
+
+
+def _json_dumps(value, indent=False):
+    if indent:
+        return json.dumps(value, indent=2)
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _json_dumpb(value):
+    return _json_dumps(value).encode("utf-8", "surrogatepass")
+
+
+def _orjson_loads(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogatepass")
+    # orjson turns integers past 64 bits into floats, stdlib keeps them exact
+    if b"0" * 19 in data.translate(_DIGITS_ONLY):
+        return _fallback_loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # NaN, BOMs, lone surrogates... stdlib takes them, so do we
+        return _fallback_loads(data)
+
+
+def _orjson_dumps(value, indent=False):
+    try:
+        out = orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0)
+    except TypeError:
+        # big ints, float subclasses, non-str keys, surrogates
+        return _json_dumps(value, indent)
+    if _float_mismatch(out):
+        return _json_dumps(value, indent)
+    if out.isascii() and b"\x7f" not in out:
+        return out.decode("ascii")
+    return _NON_ASCII.sub(_escape, out.decode("utf-8"))
+
+
+def _orjson_dumpb(value):
+    try:
+        return orjson.dumps(value)
+    except TypeError:
+        return _json_dumpb(value)
+
+
+BACKENDS = {"json": (_json_loads, _json_dumps, _json_dumpb)}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_loads, _orjson_dumps, _orjson_dumpb)
+
+
+def use(name):
+    """
+    Switches the backend for the whole process. BLOCKVINE_JSON picks it at import.
+    After this, loads(data) parses str or bytes like json.loads, and
+    dumps(value, indent=False) returns compact text, or json.dumps(value, indent=2).
+    dumpb(value) is compact UTF-8 bytes made as fast as the backend can; floats may
+    not be written like stdlib does, so it's for hashing and sending, not for files.
+    """
+    global backend, loads, dumps, dumpb
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown or unavailable JSON backend: {name}")
+    backend = name
+    loads, dumps, dumpb = BACKENDS[name]
+
+
+use(os.environ.get("BLOCKVINE_JSON") or ("orjson" if orjson is not None else "json"))
+
+
+def check_roundtrip(data):
+    """
+    Parses `data` with every backend and dumps the result both ways. Returns a list
+    of (backend, what) pairs that didn't match stdlib json byte for byte.
+    """
+    expected_value = json.loads(data)
+    expected = [_json_dumps(expected_value, indent) for indent in (False, True)]
+    mismatches = []
+    for name, (load, dump, _) in BACKENDS.items():
+        value = load(data)
+        for indent, text in zip((False, True), expected):
+            if dump(value, indent) != text:
+                mismatches.append((name, "indent" if indent else "compact"))
+        # re-parsing our own output must give the same text again
+        if dump(load(expected[1]), True) != expected[1]:
+            mismatches.append((name, "reparse"))
+    return mismatches
+
+
+def benchmark(data, rounds=3):
+    """
+    Best-of-`rounds` seconds per backend for loads, compact dumps and indented dumps.
+    """
+    results = {}
+    for name, (load, dump, _) in BACKENDS.items():
+        value = load(data)
+        timings = {}
+        for label, fn in (("loads", lambda: load(data)),
+                          ("dumps", lambda: dump(value)),
+                          ("dumps_indent", lambda: dump(value, True))):
+            best = float("inf")
+            for _ in range(rounds):
+                started = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - started)
+            timings[label] = best
+        results[name] = timings
+    return results
+
+
+SAMPLE = r'''{"ascii": "plain", "unicode": "café 😀   \u007f \u0000\b\f\n\t",
+"raw": "é😀", "floats": [0.1, 1.0, -0.0, 1e-05, 0.0001, 1e16, 1e+22, 5e-324, 123456789.123, 1E400],
+"ints": [0, -1, 9223372036854775807, 18446744073709551615, 18446744073709551616, -99999999999999999999],
+"constants": [NaN, Infinity, -Infinity], "nested": {"empty": {}, "list": [], "deep": [[{}], [[]]]},
+"lone": "\ud800", "null": null, "bool": [true, false]}'''
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    print(f"Backends: {', '.join(BACKENDS)} (using {backend})")
+
+    samples = [("built-in sample", SAMPLE.encode("utf-8"))]
+    for file in sys.argv[1:]:
+        with open(file, "rb") as f:
+            samples.append((file, f.read()))
+
+    failed = False
+    for label, data in samples:
+        mismatches = check_roundtrip(data)
+        failed = failed or bool(mismatches)
+        status = ", ".join(f"{name}/{what}" for name, what in mismatches) or "identical"
+        print(f"[ round-trip ] {label}: {status}")
+
+    for label, data in samples[1:]:
+        for name, timings in benchmark(data).items():
+            print(f"[ bench ] {label} {name}: " + "  ".join(f"{k} {v * 1000:.1f} ms" for k, v in timings.items()))
+
+    sys.exit(1 if failed else 0)
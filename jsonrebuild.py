@@ -1,6 +1,160 @@
-import json, os
+import hashlib, os, pickle
 from urllib.parse import unquote
 
+import jsoncodec
+
+def _compact(value):
+    return jsoncodec.dumps(value)
+
+class FragmentCache:
+    """
+    Persistent cache of compact fragment JSON, stored in _bvcache.
+    An entry is reused as long as the file's mtime and size match. If they don't,
+    the file is re-read, but only re-parsed when its content hash changed as well.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+        if cache_file and os.path.isfile(cache_file):
+            try:
+                with open(cache_file, "rb") as f:
+                    self.entries = pickle.load(f)
+            except Exception:
+                self.entries = {}
+
+    def start(self):
+        """
+        Resets the per-rebuild bookkeeping, so the same cache can be reused in-process.
+        """
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, index=False):
+        """
+        Returns the compact JSON text of a fragment file.
+        For index.json files, this is a list of `"key":value` members instead,
+        so they can be merged with the keys that live in subdirectories.
+        """
+        stat = os.stat(path)
+        self.seen.add(path)
+        entry = self.entries.get(path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            self.hits += 1
+            return entry[3]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.blake2b(raw, digest_size=16).digest()
+
+        if entry and entry[2] == digest:
+            self.hits += 1
+            text = entry[3]
+        else:
+            self.misses += 1
+            value = jsoncodec.loads(raw)
+            if index:
+                text = [f"{_compact(k)}:{_compact(v)}" for k, v in value.items()]
+            else:
+                text = _compact(value)
+
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, digest, text)
+        self.dirty = True
+        return text
+
+    def save(self):
+        """
+        Drops entries for fragments that weren't seen during this rebuild,
+        then writes the cache back to disk if anything changed.
+        """
+        stale = self.entries.keys() - self.seen
+        for path in stale:
+            del self.entries[path]
+
+        if not self.cache_file or not (self.dirty or stale):
+            return
+
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+        self.dirty = False
+
+def _array_items(path):
+    """
+    The item paths of an array folder, in order: N.json files, or N/ folders for
+    targets in the "scripts" layout. None if the folder isn't an array.
+    """
+    items = []
+    for entry in os.listdir(path):
+        full_path = os.path.join(path, entry)
+        if entry.endswith(".json") and entry[:-5].isdigit():
+            items.append((int(entry[:-5]), full_path))
+        elif entry.isdigit() and os.path.isdir(full_path):
+            items.append((int(entry), full_path))
+        elif entry.endswith(".json") or os.path.isdir(full_path):
+            return None
+    return [full_path for _, full_path in sorted(items)]
+
+def _script_files(path, order):
+    """
+    The script files of a "scripts" layout target: the ones target.json lists first,
+    in its order, then any others by name.
+    """
+    scripts_dir = os.path.join(path, "scripts")
+    if not os.path.isdir(scripts_dir):
+        return []
+    names = {unquote(e[:-5]): e for e in os.listdir(scripts_dir) if e.endswith(".json")}
+    listed = [script_id for script_id in order if script_id in names]
+    rest = sorted(names.keys() - set(listed))
+    return [os.path.join(scripts_dir, names[script_id]) for script_id in listed + rest]
+
+def _rebuild_item(path):
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return jsoncodec.loads(f.read())
+
+    with open(os.path.join(path, "target.json"), "rb") as f:
+        target = jsoncodec.loads(f.read())
+    if "blocks" not in target:
+        return target
+    blocks = {}
+    for script_file in _script_files(path, target.get("blocks") or []):
+        with open(script_file, "rb") as f:
+            blocks.update(jsoncodec.loads(f.read()))
+    target["blocks"] = blocks
+    return target
+
+def _iter_item_text(path, cache):
+    if os.path.isfile(path):
+        yield cache.get(path)
+        return
+
+    # Copied, the cached list must stay as it is
+    members = list(cache.get(os.path.join(path, "target.json"), index=True))
+    blocks_key = _compact("blocks") + ":"
+    position = next((i for i, m in enumerate(members) if m.startswith(blocks_key)), None)
+    if position is None:
+        yield "{" + ",".join(members) + "}"
+        return
+    order = jsoncodec.loads(members[position][len(blocks_key):])
+
+    yield "{" + ",".join(members[:position])
+    yield ("," if position else "") + blocks_key + "{"
+    first = True
+    for script_file in _script_files(path, order):
+        text = cache.get(script_file)
+        if text != "{}":
+            yield text[1:-1] if first else "," + text[1:-1]
+            first = False
+    yield "}" + "".join("," + m for m in members[position + 1:]) + "}"
+
 def rebuild_json(path):
     """
     This reassembles jsonbreak directory structure into a single JSON file.
@@ -9,16 +163,16 @@ def rebuild_json(path):
     print(f"rebuilding {path}")
 
     if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return jsoncodec.loads(f.read())
 
     entries = [e for e in os.listdir(path) if not e.startswith(".")]
     obj = {}
 
     index_path = os.path.join(path, "index.json")
     if os.path.isfile(index_path):
-        with open(index_path, "r", encoding="utf-8") as f:
-            obj.update(json.load(f))
+        with open(index_path, "rb") as f:
+            obj.update(jsoncodec.loads(f.read()))
 
     for entry in entries:
         if entry == "index.json":
@@ -28,19 +182,73 @@ def rebuild_json(path):
         decoded_key = unquote(entry)
 
         if os.path.isdir(full_path):
-            subentries = [e for e in os.listdir(full_path) if e.endswith(".json")]
-            if all(e[:-5].isdigit() for e in subentries):
-                arr = []
-                for i in sorted(map(int, [e[:-5] for e in subentries])):
-                    with open(os.path.join(full_path, f"{i}.json"), "r", encoding="utf-8") as f:
-                        arr.append(json.load(f))
-                obj[decoded_key] = arr
+            items = _array_items(full_path)
+            if items is not None:
+                obj[decoded_key] = [_rebuild_item(item) for item in items]
             else:
                 obj[decoded_key] = rebuild_json(full_path)
 
         elif entry.endswith(".json"):
             key = unquote(entry[:-5])
-            with open(full_path, "r", encoding="utf-8") as f:
-                obj[key] = json.load(f)
+            with open(full_path, "rb") as f:
+                obj[key] = jsoncodec.loads(f.read())
 
     return obj
+
+def rebuild_json_text(path, cache=None):
+    """
+    Same as rebuild_json, but returns compact JSON text instead of a dict.
+    Fragments are taken from the cache when they haven't changed, so a rebuild
+    only re-reads and re-parses the files that were actually edited.
+    """
+    return "".join(iter_json_text(path, cache))
+
+def iter_json_text(path, cache=None):
+    """
+    rebuild_json_text in pieces, about a fragment at a time, so the project can be
+    written out without its whole text ever being in memory at once.
+    """
+    if cache is None:
+        cache = FragmentCache()
+
+    if os.path.isfile(path):
+        yield cache.get(path)
+        return
+
+    entries = [e for e in os.listdir(path) if not e.startswith(".")]
+    separator = "{"
+
+    index_path = os.path.join(path, "index.json")
+    if os.path.isfile(index_path):
+        members = cache.get(index_path, index=True)
+        if members:
+            yield separator + ",".join(members)
+            separator = ","
+
+    for entry in entries:
+        if entry == "index.json":
+            continue
+
+        full_path = os.path.join(path, entry)
+        decoded_key = unquote(entry)
+
+        if os.path.isdir(full_path):
+            items = _array_items(full_path)
+            if items is not None:
+                yield f"{separator}{_compact(decoded_key)}:["
+                for i, item in enumerate(items):
+                    if i:
+                        yield ","
+                    yield from _iter_item_text(item, cache)
+                yield "]"
+            else:
+                yield f"{separator}{_compact(decoded_key)}:"
+                yield from iter_json_text(full_path, cache)
+            separator = ","
+
+        elif entry.endswith(".json"):
+            key = unquote(entry[:-5])
+            yield f"{separator}{_compact(key)}:{cache.get(full_path)}"
+            separator = ","
+
+    yield "{}" if separator == "{" else "}"
@@ -0,0 +1,168 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans slower than this many milliseconds are printed (to blockvine.log when
+# running under backend.py). 0 or unset turns it off.
+slow_threshold = float(os.environ.get("BLOCKVINE_SLOW_MS") or 0) / 1000
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """
+    Records one duration for span `name` (with optional labels).
+    """
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        i = bisect.bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+    if slow_threshold and seconds >= slow_threshold:
+        shown = "".join(f" {k}={v}" for k, v in labels.items())
+        print(f"[Metrics] Slow {name}{shown}: {seconds * 1000:.0f} ms")
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds `value` to counter `name`.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """
+    Times the with-block as span `name`. Failed blocks are recorded too,
+    and also counted in the `errors` counter.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc("errors", span=name)
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """
+    Decorator version of span().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_collector(fn, kind="counter"):
+    """
+    Registers a function that returns extra {name: value} samples for render(),
+    for numbers other modules already keep track of. `kind` is "counter" for
+    running totals, or "gauge" for current values like a queue depth.
+    """
+    _collectors.append((fn, kind))
+
+
+def snapshot():
+    """
+    Copies of the current histograms, counters and gauges, keyed by (name, labels).
+    """
+    with _lock:
+        histograms = {k: {**v, "buckets": list(v["buckets"])} for k, v in _histograms.items()}
+        counters = dict(_counters)
+    gauges = {}
+    for collector, kind in _collectors:
+        samples = counters if kind == "counter" else gauges
+        for name, value in collector().items():
+            samples[(name, ())] = value
+    return histograms, counters, gauges
+
+
+def drain():
+    """
+    The histograms and counters recorded so far, which are then reset. A worker
+    process hands these to the parent, which adds them to its own with merge().
+    """
+    global _histograms, _counters
+    with _lock:
+        histograms, counters = _histograms, _counters
+        _histograms, _counters = {}, {}
+    return histograms, counters
+
+
+def merge(histograms, counters):
+    """
+    Adds what another process's drain() returned to this process's metrics.
+    """
+    with _lock:
+        for key, other in histograms.items():
+            hist = _histograms.get(key)
+            if hist is None:
+                hist = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            hist["buckets"] = [a + b for a, b in zip(hist["buckets"], other["buckets"])]
+            hist["sum"] += other["sum"]
+            hist["count"] += other["count"]
+        for key, value in counters.items():
+            _counters[key] = _counters.get(key, 0) + value
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    histograms, counters, gauges = snapshot()
+    lines = [
+        "# HELP blockvine_span_seconds Duration of BlockVine operations.",
+        "# TYPE blockvine_span_seconds histogram",
+    ]
+    for (name, labels), hist in sorted(histograms.items()):
+        labels = (("span", name), *labels)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist["buckets"]):
+            cumulative += count
+            lines.append(f"blockvine_span_seconds_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"blockvine_span_seconds_bucket{_labels(labels, le='+Inf')} {hist['count']}")
+        lines.append(f"blockvine_span_seconds_sum{_labels(labels)} {hist['sum']}")
+        lines.append(f"blockvine_span_seconds_count{_labels(labels)} {hist['count']}")
+
+    for samples, kind, suffix in ((counters, "counter", "_total"), (gauges, "gauge", "")):
+        for name in sorted({name for name, _ in samples}):
+            lines.append(f"# TYPE blockvine_{name}{suffix} {kind}")
+            for (sample, labels), value in sorted(samples.items()):
+                if sample == name:
+                    lines.append(f"blockvine_{name}{suffix}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
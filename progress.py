@@ -0,0 +1,44 @@
+import os
+
+USE_EMOJI = os.name != "nt"  # windows can't print emojis to terminal or else it explodes
+
+# stage -> (emoji, fallback) used when progress events are printed
+ICONS = {
+    "extract": ("🗜️", "ZIP"),
+    "sort": ("📂", "FOLDER"),
+    "json": ("🧩", "FOLDER"),
+    "pack": ("🗜️", "ZIP"),
+    "cleanup": ("🧹", "POST"),
+    "git": ("+🌱", "GIT"),
+    "git.done": ("+😁", "GIT.OK"),
+    "done": ("😁", "OK"),
+}
+LEVEL_ICONS = {
+    "warn": ("⚠️", "WARN"),
+    "error": ("❌", "ERROR"),
+}
+
+
+def icon(emoji, fallback):
+    return emoji if USE_EMOJI else fallback
+
+
+def emit(progress, stage, message, level="info", **data):
+    """
+    Sends a structured progress event to `progress`, if there is one.
+    Events are plain dicts: stage, level and message, plus any extra data.
+    """
+    if progress:
+        progress({"stage": stage, "level": level, "message": message, **data})
+
+
+def format_progress(event):
+    """
+    Renders an event the way the CLIs always printed them, e.g. "[ 😁 ] All done!"
+    """
+    emoji, fallback = LEVEL_ICONS.get(event["level"]) or ICONS.get(event["stage"], ("•", "INFO"))
+    return f"[ {icon(emoji, fallback)} ] {event['message']}"
+
+
+def print_progress(event):
+    print(format_progress(event))
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import zipfile
+
+import jsoncodec
+
+# What the editor can patch into a sprite that's already loaded (see userscript.js)
+CODE_KEYS = ("blocks", "variables", "lists", "comments")
+PROP_KEYS = ("x", "y", "size", "direction", "visible", "draggable", "rotationStyle", "currentCostume", "volume")
+# Changing these needs the assets reloaded, i.e. a full loadProject
+ASSET_KEYS = ("costumes", "sounds")
+# Project keys besides the targets that the editor cares about
+PROJECT_KEYS = ("monitors", "extensions")
+
+
+def _digest(value):
+    return hashlib.blake2b(jsoncodec.dumpb(value), digest_size=16).digest()
+
+
+def _split_target(target):
+    parts = {"code": {}, "props": {}, "assets": {}, "other": {}}
+    for key, value in target.items():
+        if key in CODE_KEYS:
+            parts["code"][key] = value
+        elif key in PROP_KEYS:
+            parts["props"][key] = value
+        elif key in ASSET_KEYS:
+            parts["assets"][key] = value
+        else:
+            parts["other"][key] = value
+    return {name: _digest(part) for name, part in parts.items()}
+
+
+def summarize(sb3_path):
+    """
+    Reads the project.json of an .sb3 and returns (stat, summary): the stat of the
+    file that was actually read, and digests of each target's parts (plus its
+    compact JSON bytes, under "texts") to diff against other versions with diff().
+    """
+    with open(sb3_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        with zipfile.ZipFile(f) as zip_ref:
+            raw = zip_ref.read("project.json")
+
+    with jsoncodec.gc_paused():
+        project = jsoncodec.loads(raw)
+
+    targets = project.get("targets", [])
+    return stat, {
+        "order": [(t.get("name"), bool(t.get("isStage"))) for t in targets],
+        "project": _digest({key: project.get(key) for key in PROJECT_KEYS}),
+        "targets": {t.get("name"): _split_target(t) for t in targets},
+        "texts": {t.get("name"): jsoncodec.dumpb(t) for t in targets},
+    }
+
+
+def diff(old, new):
+    """
+    Compares two summaries. Returns (reason, changed): `reason` says why the editor
+    needs a full reload, or is None when patching the `changed` sprites is enough.
+    """
+    if old["order"] != new["order"]:
+        return "sprites were added, removed, renamed or reordered", []
+    if len(dict(new["order"])) != len(new["order"]):
+        return "two targets share a name", []
+    if old["project"] != new["project"]:
+        return "monitors or extensions changed", []
+
+    changed = []
+    for name, is_stage in new["order"]:
+        before, after = old["targets"][name], new["targets"][name]
+        if before == after:
+            continue
+        if is_stage:
+            return "the stage changed", []
+        if before["assets"] != after["assets"]:
+            return f"costumes or sounds of {name} changed", []
+        if before["other"] != after["other"]:
+            return f"{name} changed in a way that can't be patched", []
+        changed.append(name)
+    return None, changed
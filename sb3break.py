@@ -2,148 +2,394 @@
 
 import os
 import sys
+import time
+import queue
 import zipfile
 import shutil
-import json
-import time
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-sys.stdout.reconfigure(encoding="utf-8")
-
-USE_EMOJI = os.name != "nt"  # windows can't print emojis to terminal or else it explodes
-
-def icon(emoji, fallback):
-    return emoji if USE_EMOJI else fallback
+import jsoncodec
+from audioprobe import probe_duration
+import metrics
+from progress import emit, icon, print_progress
+from sb3rebuild import ASSET_CATEGORIES, file_crc
 
 try:
-    from jsonbreak import disassemble_json
+    from jsonbreak import LAYOUTS, disassemble_json, read_layout, write_manifest
 except ImportError:
     print(f"[ {icon('⚠️', 'WARN')} ] sb3break depends on jsonbreak.py. Make sure it’s in the same directory.")
     sys.exit(1)
 
-def organize_sb3(sb3_path):
+GITIGNORE = """# Python
+__pycache__/
+*.pyc
+*.pyo
+
+# macOS
+.DS_Store
+
+# Editor junk
+*.swp
+*.swo
+.vscode/
+.idea/
+
+# BlockVine cache
+_bvcache/
+"""
+
+# Rough peak memory of converting one project: the interpreter, plus ~12x the
+# project.json text for the parsed dict and the fragments made from it.
+# Assets are streamed in 1 MB chunks, so their size doesn't matter.
+BASE_MEMORY = 32 << 20
+JSON_MEMORY_FACTOR = 12
+
+def classify_asset(file, progress=None, opener=None):
+    """
+    Picks the assets/ subfolder for a file, or None if it isn't an asset.
+    Sounds of 5 seconds or less count as audio, longer ones as bgm.
+    `opener` returns a binary file for `file` when it isn't on disk (e.g. a zip member).
+    """
+    ext = file.suffix.lower()
+
+    if ext in [".png", ".jpg", ".jpeg"]:
+        return "raster"
+
+    elif ext == ".svg":
+        return "vector"
+
+    elif ext in [".wav", ".mp3", ".ogg"]:
+        opener = opener or (lambda file: open(file, "rb"))
+        try:
+            with opener(file) as f:
+                duration = probe_duration(f)
+            if duration is None:
+                # headers didn't say, decode the whole thing with pydub
+                try:
+                    from pydub import AudioSegment
+                    with opener(file) as f:
+                        duration = len(AudioSegment.from_file(f, format=ext[1:])) / 1000
+                except Exception:
+                    duration = 0
+            return "audio" if duration <= 5 else "bgm"
+        except Exception as e:
+            emit(progress, "sort", f"Unknown duration for file {file.name}: {e}", level="warn")
+            return "audio"
+
+    elif ext in [".ttf", ".otf", ".woff", ".woff2"]:
+        return "font"
+
+    return None
+
+def classify_assets(files, progress=None, opener=None):
+    """
+    classify_asset over many files at once, on a thread pool.
+    Returns a {file: category} dict.
+    """
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+        return dict(zip(files, pool.map(lambda file: classify_asset(file, progress, opener), files)))
+
+def _extract_assets(zip_ref, members, out_dir, subdirs, progress):
+    """
+    Streams zip members straight to their assets/ subfolder (or the project root
+    for anything that isn't an asset), so every byte is written once.
+    Returns the number of bytes written.
+    """
+    files = {Path(info.filename): info for info in members}
+    with metrics.span("break.classify"):
+        categories = classify_assets(files, progress, opener=lambda file: zip_ref.open(files[file]))
+
+    written = 0
+    with metrics.span("break.extract"):
+        for file, info in files.items():
+            category = categories[file]
+            if category:
+                with zip_ref.open(info) as src, open(subdirs[category] / file.name, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            else:
+                zip_ref.extract(info, out_dir)
+            written += info.file_size
+    metrics.inc("bytes_written", written)
+    return written
+
+def default_out_dir(sb3_path):
+    return Path.home() / "BlockVine" / Path(sb3_path).stem
+
+def organize_sb3(sb3_path, out_dir=None, progress=print_progress, layout="flat"):
+    """
+    Breaks an .sb3 up into a BlockVine project folder (src/ + sorted assets/).
+    `layout` is the fragment layout of src/, see jsonbreak.LAYOUTS; it's recorded
+    in the project's manifest so later syncs keep it.
+    Returns the project folder. Progress is reported through `progress` events.
+    """
     sb3_path = Path(sb3_path).expanduser().resolve()
     if not sb3_path.exists() or sb3_path.suffix != ".sb3":
-        print(f"[ {icon('❌', 'ERROR')} ] {sb3_path} is an unsupported or nonexistent file.")
-        return
+        raise FileNotFoundError(f"{sb3_path} is an unsupported or nonexistent file.")
 
-    home = Path.home()
-    if len(sys.argv) >= 3 and not sys.argv[2].startswith("--"):
-        out_dir = Path(sys.argv[2])
-    else:
-        out_dir = home / "BlockVine" / sb3_path.stem
+    out_dir = Path(out_dir).expanduser().resolve() if out_dir else default_out_dir(sb3_path)
     assets_dir = out_dir / "assets"
-
-    print(f"[ {icon('🗜️', 'ZIP')} ] Extracting {sb3_path.name} to {out_dir}...")
     out_dir.mkdir(parents=True, exist_ok=True)
+
+    subdirs = {category: assets_dir / category for category in ASSET_CATEGORIES}
+    for d in subdirs.values():
+        d.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    emit(progress, "extract", f"Extracting {sb3_path.name} to {out_dir}...")
     with zipfile.ZipFile(sb3_path, 'r') as zip_ref:
-        zip_ref.extractall(out_dir)
-
-    subdirs = {
-        "raster": assets_dir / "raster",
-        "vector": assets_dir / "vector",
-        "audio": assets_dir / "audio",
-        "bgm": assets_dir / "bgm",
-        "font": assets_dir / "font"
-    }
+        members = [info for info in zip_ref.infolist() if not info.is_dir() and info.filename != "project.json"]
+        emit(progress, "sort", "Sorting assets...")
+        bytes_written = _extract_assets(zip_ref, members, out_dir, subdirs, progress)
+
+        emit(progress, "json", "Breaking up project JSON...")
+        try:
+            with metrics.span("break.json"):
+                with zip_ref.open("project.json") as f:
+                    data = jsoncodec.loads(f.read())
+                # Pruned, so nothing of an earlier conversion (or layout) is left over
+                stats = disassemble_json(data, str(out_dir / "src"), prune=True, layout=layout)
+                write_manifest(out_dir, layout)
+        except Exception as e:
+            emit(progress, "json", f"jsonbreak failed: {e}", level="error")
+            raise
+    bytes_written += stats["bytes_written"]
+    metrics.inc("bytes_written", stats["bytes_written"])
+
+    elapsed = time.perf_counter() - started
+    emit(progress, "done", f"All done! Your project folder was generated at {out_dir} "
+         f"({bytes_written / 1e6:.1f} MB written in {elapsed:.2f}s)",
+         out_dir=str(out_dir), bytes_written=bytes_written, seconds=elapsed)
+    return out_dir
+
+def sync_sb3(sb3_path, out_dir, progress=print_progress):
+    """
+    Brings an existing project folder in line with its .sb3, touching only what differs.
+    Fragments are rewritten only if their JSON changed, and assets are only added,
+    replaced or deleted where the archive disagrees with the folder. Everything else
+    keeps its bytes and mtime, so git and the watcher only see real changes.
+    """
+    sb3_path = Path(sb3_path).expanduser().resolve()
+    out_dir = Path(out_dir).expanduser().resolve()
+    if not sb3_path.exists() or sb3_path.suffix != ".sb3":
+        raise FileNotFoundError(f"{sb3_path} is an unsupported or nonexistent file.")
+
+    assets_dir = out_dir / "assets"
+    subdirs = {category: assets_dir / category for category in ASSET_CATEGORIES}
+    existing = {}
     for d in subdirs.values():
         d.mkdir(parents=True, exist_ok=True)
+        for file in d.iterdir():
+            if file.is_file():
+                existing[file.name] = file
+
+    emit(progress, "extract", f"Syncing {sb3_path.name} into {out_dir}...")
+    added = []
+    replaced = 0
+    with zipfile.ZipFile(sb3_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            name = info.filename
+            if info.is_dir() or "/" in name or name == "project.json":
+                continue
 
-    print(f"[ {icon('📂', 'FOLDER')} ] Sorting assets...")
-    for file in out_dir.glob("*"):
-        if not file.is_file():
-            continue
-        ext = file.suffix.lower()
+            current = existing.pop(name, None)
+            if current:
+                if current.stat().st_size == info.file_size and file_crc(current) == info.CRC:
+                    continue
+                with zip_ref.open(info) as src, open(current, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                replaced += 1
+                continue
 
-        if ext in [".png", ".jpg", ".jpeg"]:
-            shutil.move(str(file), subdirs["raster"] / file.name)
+            added.append(info)
 
-        elif ext == ".svg":
-            shutil.move(str(file), subdirs["vector"] / file.name)
+        _extract_assets(zip_ref, added, out_dir, subdirs, progress)
+        for file in existing.values():
+            file.unlink()
+        emit(progress, "sort", f"Assets: {len(added)} added, {replaced} replaced, {len(existing)} deleted",
+             added=len(added), replaced=replaced, deleted=len(existing))
 
-        elif ext in [".wav", ".mp3", ".ogg"]:
-            try:
-                import wave
-                import contextlib
-                if ext == ".wav":
-                    with contextlib.closing(wave.open(str(file), 'r')) as f:
-                        duration = f.getnframes() / float(f.getframerate())
-                else:
-                    # rough non-wav estimate using pydub
-                    try:
-                        from pydub import AudioSegment
-                        duration = len(AudioSegment.from_file(file)) / 1000
-                    except Exception:
-                        duration = 0
-                if duration <= 5:
-                    shutil.move(str(file), subdirs["audio"] / file.name)
-                else:
-                    shutil.move(str(file), subdirs["bgm"] / file.name)
-            except Exception as e:
-                print(f"[ {icon('⚠️', 'WARN')} ] Unknown duration for file {file.name}: {e}")
-                shutil.move(str(file), subdirs["audio"] / file.name)
+        emit(progress, "json", "Syncing project JSON...")
+        with metrics.span("break.json"):
+            with zip_ref.open("project.json") as f:
+                data = jsoncodec.loads(f.read())
+            stats = disassemble_json(data, str(out_dir / "src"), prune=True, layout=read_layout(out_dir))
+    metrics.inc("bytes_written", stats["bytes_written"])
+    emit(progress, "json", f"Fragments: {stats['written']} written, {stats['skipped']} unchanged, "
+         f"{stats['deleted']} deleted", **stats)
 
-        elif ext in [".ttf", ".otf", ".woff", ".woff2"]:
-            shutil.move(str(file), subdirs["font"] / file.name)
+    emit(progress, "done", f"All done! {out_dir} is in sync with {sb3_path.name}", out_dir=str(out_dir))
+    return out_dir
+
+def init_git(out_dir, progress=print_progress):
+    """
+    Turns a freshly generated project folder into a Git repo with an initial commit.
+    Does nothing if the folder already is one.
+    """
+    out_dir = Path(out_dir)
+    if (out_dir / ".git").exists():
+        return
 
-    project_json = out_dir / "project.json"
-    print(f"[ {icon('🧩', 'FOLDER')} ] Breaking up project JSON...")
     try:
-        with open(project_json, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        disassemble_json(data, str(out_dir / "src"))
-    except Exception as e:
-        print(f"[ :( ] jsonbreak failed: {e}")
+        emit(progress, "git", "Init Git...")
+        subprocess.run(["git", "init", "-b", "main"], cwd=out_dir, check=True, stdout=subprocess.PIPE)
+        (out_dir / ".gitignore").write_text(GITIGNORE, encoding="utf-8")
 
-    if project_json.exists():
-        project_json.unlink()
-        print(f"[ {icon('🧹', 'POST')} ] Cleanup: deleted original project.json")
+        subprocess.run(["git", "add", "."], cwd=out_dir, check=True, stdout=subprocess.PIPE)
+        subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=out_dir, check=True, stdout=subprocess.PIPE)
 
-    print(f"[ {icon('😁', 'OK')} ] All done! Your project folder was generated at {out_dir}")
+        emit(progress, "git.done", "Git repo initialized. Default branch is main.")
+    except subprocess.CalledProcessError as e:
+        emit(progress, "git", f"Git init failed: {e}", level="warn")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python sb3break.py </path/to/sb3> [output_dir] [--git]")
-        sys.exit(1)
+def convert_sb3(sb3_path, out_dir=None, use_git=False, progress=print_progress, layout="flat"):
+    """
+    organize_sb3 followed by init_git, i.e. what the CLI does.
+    """
+    out_dir = organize_sb3(sb3_path, out_dir, progress=progress, layout=layout)
+    if use_git:
+        init_git(out_dir, progress=progress)
+    return out_dir
+
+def estimate_memory(sb3_path):
+    """
+    Bytes converting sb3_path is expected to need at its peak, see BASE_MEMORY.
+    """
+    try:
+        with zipfile.ZipFile(sb3_path) as zip_ref:
+            json_size = zip_ref.getinfo("project.json").file_size
+    except (OSError, KeyError, zipfile.BadZipFile):
+        json_size = 0
+    return BASE_MEMORY + JSON_MEMORY_FACTOR * json_size
+
+def default_memory_budget():
+    """
+    Half the machine's memory, or 2 GB where that can't be found out.
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return 2 << 30
+
+_worker_events = None
+
+def _init_worker(events):
+    global _worker_events
+    _worker_events = events
+
+def _convert_job(sb3_path, out_dir, use_git, layout, progress=None):
+    """
+    convert_sb3 for one file of a batch, with every event tagged with the file.
+    Failures are reported as an error event too, so they arrive in order with the rest.
+    """
+    progress = progress or _worker_events.put
+    tag = lambda event: progress({**event, "file": str(sb3_path)})
+    try:
+        return str(convert_sb3(sb3_path, out_dir, use_git=use_git, progress=tag, layout=layout))
+    except Exception as e:
+        emit(tag, "done", str(e), level="error")
+        raise
+
+def convert_many(sb3_paths, out_dirs=None, use_git=False, jobs=None, memory_budget=None, progress=print_progress,
+                 layout="flat"):
+    """
+    convert_sb3 for many files on a pool of `jobs` processes (default: one per CPU).
+    Progress events from all files arrive interleaved, each tagged with its "file".
+    A file only starts once the estimated memory of everything running fits in
+    `memory_budget` bytes, so huge projects don't run side by side; one file
+    always runs, however big. Returns {sb3_path: out_dir, or the exception}.
+    """
+    sb3_paths = [str(path) for path in sb3_paths]
+    out_dirs = out_dirs or [None] * len(sb3_paths)
+    jobs = min(jobs or os.cpu_count() or 1, len(sb3_paths)) or 1
+    budget = memory_budget or default_memory_budget()
+    results = {}
+
+    if jobs == 1:
+        for sb3_path, out_dir in zip(sb3_paths, out_dirs):
+            try:
+                results[sb3_path] = _convert_job(sb3_path, out_dir, use_git, layout, progress)
+            except Exception as e:
+                results[sb3_path] = e
+        return results
 
-    sb3_file = sys.argv[1]
-    use_git = "--git" in sys.argv
+    waiting = [(sb3_path, out_dir, estimate_memory(sb3_path)) for sb3_path, out_dir in zip(sb3_paths, out_dirs)]
+    running = {}
+    events = multiprocessing.Queue()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(events,)) as pool:
+        while waiting or running:
+            used = sum(estimate for _, estimate in running.values())
+            while waiting and len(running) < jobs and (not running or used + waiting[0][2] <= budget):
+                sb3_path, out_dir, estimate = waiting.pop(0)
+                running[pool.submit(_convert_job, sb3_path, out_dir, use_git, layout)] = (sb3_path, estimate)
+                used += estimate
 
-    organize_sb3(sb3_file)
+            try:
+                progress(events.get(timeout=0.1))
+            except queue.Empty:
+                pass
 
-    if len(sys.argv) >= 3 and not sys.argv[2].startswith("--"):
-        out_dir = Path(sys.argv[2]).expanduser().resolve()
-    else:
-        out_dir = Path.home() / "BlockVine" / Path(sb3_file).stem
+            for future in [future for future in running if future.done()]:
+                sb3_path, _ = running.pop(future)
+                try:
+                    results[sb3_path] = future.result()
+                except Exception as e:
+                    results[sb3_path] = e
 
-    if use_git and not (out_dir / ".git").exists():
-        import subprocess
+    # Whatever the workers sent just before finishing
+    while True:
         try:
-            print(f"[ {icon('+🌱', 'GIT')} ] Init Git...")
-            subprocess.run(["git", "init", "-b", "main"], cwd=out_dir, check=True, stdout=subprocess.PIPE)
-            gitignore_content = """# Python
-__pycache__/
-*.pyc
-*.pyo
+            progress(events.get(timeout=0.1))
+        except queue.Empty:
+            break
+    return results
 
-# macOS
-.DS_Store
+def print_json_event(event):
+    print(jsoncodec.dumps(event), flush=True)
 
-# Editor junk
-*.swp
-*.swo
-.vscode/
-.idea/
+USAGE = """Usage: python sb3break.py </path/to/sb3> [output_dir] [--git] [--sync] [--layout flat|scripts]
+       python sb3break.py <a.sb3> <b.sb3>... [--git] [--jobs N] [--memory-mb N] [--json] [--layout flat|scripts]"""
 
-# BlockVine cache
-_bvcache/
-"""
-            gitignore_path = out_dir / ".gitignore"
-            gitignore_path.write_text(gitignore_content, encoding="utf-8")
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
 
-            subprocess.run(["git", "add", "."], cwd=out_dir, check=True)
-            subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=out_dir, check=True)
+    inputs = []
+    options = {"--jobs": None, "--memory-mb": None}
+    layout = "flat"
+    valid = True
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in options:
+            value = next(args, "")
+            # Counts, so only plain non-negative integers
+            valid = valid and value.isascii() and value.isdigit()
+            options[arg] = int(value) if valid else None
+        elif arg == "--layout":
+            layout = next(args, "")
+        elif not arg.startswith("--"):
+            inputs.append(arg)
+
+    if not inputs or not valid or layout not in LAYOUTS:
+        print(USAGE)
+        sys.exit(1)
+
+    progress = print_json_event if "--json" in sys.argv else print_progress
+    # sb3break.py project.sb3 out_dir
+    out_dir = inputs.pop() if len(inputs) == 2 and not inputs[1].endswith(".sb3") else None
+
+    if "--sync" in sys.argv:
+        try:
+            sync_sb3(inputs[0], out_dir or default_out_dir(inputs[0]), progress=progress)
+        except Exception as e:
+            progress({"stage": "done", "level": "error", "message": str(e)})
+            sys.exit(1)
+        sys.exit(0)
 
-            print(f"[ {icon('+😁', 'GIT.OK')} ] Git repo initialized. Default branch is main.")
-        except subprocess.CalledProcessError as e:
-            print(f"[ {icon('+⚠️', 'GIT.WARN')} ] Git init failed: {e}")
+    memory_mb = options["--memory-mb"]
+    results = convert_many(inputs, [out_dir] if out_dir else None, use_git="--git" in sys.argv,
+                           jobs=options["--jobs"], memory_budget=memory_mb and memory_mb << 20, progress=progress,
+                           layout=layout)
+    sys.exit(1 if any(isinstance(result, Exception) for result in results.values()) else 0)
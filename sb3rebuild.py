@@ -2,68 +2,219 @@
 
 import os
 import sys
-import shutil
+import json
+import time
+import struct
 import zipfile
+import zlib
 from pathlib import Path
-import json
-
-sys.stdout.reconfigure(encoding="utf-8")
-
-USE_EMOJI = os.name != "nt"  # windows can't print emojis to terminal or else it explodes
 
-def icon(emoji, fallback):
-    return emoji if USE_EMOJI else fallback
+import metrics
+from progress import emit, icon, print_progress
 
 try:
-    from jsonrebuild import rebuild_json
+    from jsonrebuild import FragmentCache, iter_json_text
 except ImportError:
     print(f"[ {icon('⚠️', 'WARN')} ] sb3rebuild depends on jsonrebuild.py. Make sure it’s in the same directory.")
     sys.exit(1)
 
-def rebuild_sb3(project_dir):
+ASSET_CATEGORIES = ["raster", "vector", "audio", "bgm", "font"]
+
+class Cancelled(Exception):
+    """
+    Raised by rebuild_sb3 when its `cancel` callback asks it to stop.
+    """
+
+# These formats are compressed already, so deflating them again only burns CPU
+STORED_EXTS = {".png", ".jpg", ".jpeg", ".mp3", ".ogg", ".woff", ".woff2"}
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def file_crc(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _old_member(old_zip, name):
+    if old_zip is None:
+        return None
+    try:
+        return old_zip.getinfo(name)
+    except KeyError:
+        return None
+
+def _copy_member(src_zip, info, dst_zip):
+    """
+    Copies a member's compressed bytes from one archive into another verbatim,
+    so unchanged assets never get decompressed or recompressed.
+    zipfile has no public API for this, hence the raw header handling.
+    """
+    src_zip.fp.seek(info.header_offset)
+    header = src_zip.fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src_zip.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+
+    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.external_attr = info.external_attr
+    # Sizes go straight into the local header, so no data descriptor is needed
+    new_info.flag_bits = info.flag_bits & ~0x08
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+
+    with dst_zip._lock:
+        new_info.header_offset = dst_zip.fp.tell()
+        dst_zip.fp.write(new_info.FileHeader())
+        remaining = info.compress_size
+        while remaining:
+            chunk = src_zip.fp.read(min(remaining, 1 << 20))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member {info.filename}")
+            dst_zip.fp.write(chunk)
+            remaining -= len(chunk)
+        dst_zip.filelist.append(new_info)
+        dst_zip.NameToInfo[new_info.filename] = new_info
+        dst_zip.start_dir = dst_zip.fp.tell()
+        dst_zip._didModify = True
+
+def _write_pieces(zipf, name, pieces, chunk_size=1 << 20):
+    """
+    Writes text pieces into a new deflated member, in ~1 MB chunks.
+    """
+    info = zipfile.ZipInfo(name, time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    buffered, size = [], 0
+    with zipf.open(info, "w") as f:
+        for piece in pieces:
+            buffered.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                f.write("".join(buffered).encode("utf-8"))
+                buffered, size = [], 0
+        f.write("".join(buffered).encode("utf-8"))
+
+def rebuild_sb3(project_dir, reuse=True, progress=print_progress, cache=None, cancel=None):
+    """
+    Packs a project folder back into its sibling .sb3 and returns its path.
+    Assets are streamed straight from assets/<category>. With `reuse`, members
+    that didn't change are copied over from the previous .sb3 without recompressing.
+    A long-running caller can pass its own FragmentCache to keep it warm in memory.
+    `cancel` is polled between steps; once it returns True the rebuild raises
+    Cancelled and the existing .sb3 is left as it was.
+    """
+    def check_cancel():
+        if cancel and cancel():
+            raise Cancelled(f"Rebuild of {project_dir} was cancelled")
+
     project_dir = Path(project_dir).expanduser().resolve()
+    if not project_dir.exists():
+        raise FileNotFoundError(f"Could not find {project_dir}")
     bvcache_dir = project_dir / "_bvcache"
     bvcache_dir.mkdir(parents=True, exist_ok=True)
-    if not project_dir.exists():
-        print(f"[ {icon('❌', 'ERROR')} ] Could not find {project_dir}")
-        return
 
     assets_dir = project_dir / "assets"
     sb3_out = project_dir.with_suffix(".sb3")
 
-    print(f"[ {icon('🧩', 'FOLDER')} ] Rebuilding JSON...")
+    if cache is None:
+        cache = FragmentCache(str(bvcache_dir / "fragments.cache"))
+
+    assets = {}
+    with metrics.span("rebuild.assets"):
+        for category in ASSET_CATEGORIES:
+            src_dir = assets_dir / category
+            if not src_dir.exists():
+                continue
+            for file in sorted(src_dir.glob("*")):
+                if file.is_file():
+                    assets[file.name] = file
+
+    manifest_file = bvcache_dir / "pack.json"
+    manifest = {}
+    if reuse and manifest_file.exists():
+        try:
+            manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+        except ValueError:
+            manifest = {}
+
+    old_zip = None
+    if reuse and sb3_out.exists():
+        try:
+            old_zip = zipfile.ZipFile(sb3_out, "r")
+        except zipfile.BadZipFile:
+            old_zip = None
+    # The manifest only describes the old archive if nobody else rewrote it since
+    packed = manifest.get("members", {}) if old_zip and manifest.get("sb3") == _stat_key(sb3_out) else {}
+
+    members = {}
+    reused = 0
+    tmp_out = sb3_out.with_name(sb3_out.name + ".tmp")
     try:
-        rebuiltjson = rebuild_json(str(project_dir / "src"))
-        with open(str(bvcache_dir / "project.json"), "w", encoding="utf-8") as f:
-            json.dump(rebuiltjson, f, separators=(',', ':'))
-    except Exception as e:
-        print(f"[ :( ] jsonrebuild.rebuild_json failed: {e}")
-        return
-
-    print(f"[ {icon('📤', 'FOLDER')} ] Moving assets back into the main directory...")
-    for category in ["raster", "vector", "audio", "bgm", "font"]:
-        src_dir = assets_dir / category
-        if not src_dir.exists():
-            continue
-        for file in src_dir.glob("*"):
-            if file.is_file():
-                dest = bvcache_dir / file.name
-                if dest.exists():
-                    dest.unlink()
-                shutil.copy(file, dest)
-
-    print(f"[ {icon('🗜️', 'ZIP')} ] Repacking into an SB3 archive...")
-    with zipfile.ZipFile(sb3_out, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file in bvcache_dir.glob("*"):
-            if file.is_file() and file.name != sb3_out.name:
-                zipf.write(file, arcname=file.name)
-
-    print(f"[ {icon('😁', 'OK')} ] All done! SB3 exported at ", sb3_out)
+        with zipfile.ZipFile(tmp_out, "w", zipfile.ZIP_DEFLATED) as zipf:
+            # project.json goes straight into the archive as the fragments are read,
+            # so neither its text nor its bytes are ever held whole
+            emit(progress, "json", "Rebuilding JSON...")
+            try:
+                cache.start()
+                with metrics.span("rebuild.json"):
+                    _write_pieces(zipf, "project.json", iter_json_text(str(project_dir / "src"), cache))
+                    cache.save()
+            except Exception as e:
+                emit(progress, "json", f"jsonrebuild.rebuild_json failed: {e}", level="error")
+                raise
+            emit(progress, "json", f"Reused {cache.hits} cached fragments, parsed {cache.misses}",
+                 hits=cache.hits, misses=cache.misses)
+            check_cancel()
+            metrics.inc("fragment_cache_hits", cache.hits)
+            metrics.inc("fragment_cache_misses", cache.misses)
+
+            emit(progress, "pack", "Repacking into an SB3 archive...")
+            with metrics.span("rebuild.pack"):
+                for name, file in assets.items():
+                    check_cancel()
+                    stat_key = _stat_key(file)
+                    members[name] = stat_key
+                    old_info = _old_member(old_zip, name)
+
+                    if old_info and old_info.file_size == stat_key[1] and (
+                        packed.get(name) == stat_key or file_crc(file) == old_info.CRC
+                    ):
+                        _copy_member(old_zip, old_info, zipf)
+                        reused += 1
+                        continue
+
+                    compress_type = zipfile.ZIP_STORED if file.suffix.lower() in STORED_EXTS else zipfile.ZIP_DEFLATED
+                    zipf.write(file, arcname=name, compress_type=compress_type)
+    except BaseException:
+        tmp_out.unlink(missing_ok=True)
+        raise
+    finally:
+        if old_zip:
+            old_zip.close()
+
+    os.replace(tmp_out, sb3_out)
+    manifest_file.write_text(json.dumps({"sb3": _stat_key(sb3_out), "members": members}), encoding="utf-8")
+    emit(progress, "pack", f"Reused {reused} of {len(assets)} packed assets", reused=reused, total=len(assets))
+    metrics.inc("assets_reused", reused)
+    metrics.inc("assets_packed", len(assets) - reused)
+
+    emit(progress, "done", f"All done! SB3 exported at {sb3_out}", sb3=str(sb3_out))
+    return sb3_out
 
 if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+
     if len(sys.argv) < 2:
-        print("Usage: python sb3rebuild.py <path_to_unzipped_project_dir>")
+        print("Usage: python sb3rebuild.py <path_to_unzipped_project_dir> [--no-reuse]")
         sys.exit(1)
 
     project_dir = sys.argv[1]
-    rebuild_sb3(project_dir)
+    try:
+        rebuild_sb3(project_dir, reuse="--no-reuse" not in sys.argv)
+    except Exception as e:
+        print_progress({"stage": "done", "level": "error", "message": str(e)})
+        sys.exit(1)
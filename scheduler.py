@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+
+import metrics
+from fswatch import snapshot_dir, snapshot_file
+from sb3rebuild import Cancelled
+
+
+class BuildScheduler:
+    """
+    Turns watcher changes for one project into rebuild/sync jobs.
+
+    Changes are collected until the project has been quiet for `debounce` seconds
+    (or `max_delay` passed since the first one), then run as a single job on the
+    scheduler's own thread, so at most one job runs at a time and the watcher
+    keeps receiving changes meanwhile. Tree changes mean a rebuild, a changed
+    .sb3 alone means a sync; when both changed, the tree wins like it always did.
+
+    New tree changes cancel a running rebuild, which is then redone with
+    everything that changed. The retry isn't cancelled again, so a steady stream
+    of edits can't starve reloads.
+
+    Files a job wrote itself (the .sb3 after a rebuild, the tree after a sync) are
+    remembered by their stat, and changes matching it are dropped, which stops the
+    rebuild -> sync -> rebuild ping-pong.
+
+    With a ContentIndex, changes that didn't alter any file's content (a touch,
+    a checkout back to the same commit) are dropped as well.
+    """
+
+    def __init__(self, proj_dir, sb3_path, rebuild, sync, debounce=0.25, max_delay=2.0, content=None):
+        self.proj_dir = proj_dir
+        self.sb3_path = sb3_path
+        # rebuild(cancel) and sync() run the actual jobs
+        self.rebuild = rebuild
+        self.sync = sync
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.content = content
+
+        self.cond = threading.Condition()
+        self.tree_changes = set()
+        self.sb3_changed = False
+        self.batches = 0
+        self.first_change = None
+        self.last_change = None
+        self.running = None
+        self.cancel_event = None
+        self.retrying = False
+        # path -> stat our own last job left it with (None = deleted)
+        self.expected = {}
+        self.counters = {"events": 0, "suppressed": 0, "unchanged": 0, "coalesced": 0,
+                         "rebuilds": 0, "syncs": 0, "cancelled": 0, "failed": 0}
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._loop, daemon=True,
+                                       name=f"blockvine-scheduler-{os.path.basename(proj_dir)}")
+        self.thread.start()
+
+    def _self_write(self, path):
+        # An inotify overflow reports the project folder itself: that one is never ours
+        return path != self.proj_dir and path in self.expected and snapshot_file(path) == self.expected[path]
+
+    def _has_pending(self):
+        return bool(self.tree_changes) or self.sb3_changed
+
+    def submit(self, changed):
+        """
+        Hands a batch of changed paths from the watcher to the scheduler.
+        """
+        # Hashed outside the lock, the .sb3 can take a while; every path is
+        # checked, so the index learns about our own writes too
+        same = {p for p in changed if p != self.proj_dir and not self.content.changed(p)} if self.content else set()
+        with self.cond:
+            real = {p for p in changed if not self._self_write(p)}
+            self.counters["events"] += len(changed)
+            self.counters["suppressed"] += len(changed) - len(real)
+            self.counters["unchanged"] += len(real & same)
+            real -= same
+            if not real:
+                return
+
+            tree = real - {self.sb3_path}
+            self.tree_changes |= tree
+            self.sb3_changed = self.sb3_changed or self.sb3_path in real
+            self.batches += 1
+            now = time.monotonic()
+            self.first_change = self.first_change or now
+            self.last_change = now
+
+            if tree and self.running == "rebuild" and not self.retrying:
+                self.cancel_event.set()
+            self.cond.notify_all()
+
+    def _wait_for_job(self):
+        """
+        Blocks until a debounced batch is ready and takes it. Returns None once closed.
+        """
+        with self.cond:
+            while True:
+                if self.closed:
+                    return None
+                if not self._has_pending():
+                    self.cond.wait()
+                    continue
+                now = time.monotonic()
+                ready_at = min(self.last_change + self.debounce, self.first_change + self.max_delay)
+                if now < ready_at:
+                    self.cond.wait(ready_at - now)
+                    continue
+                break
+
+            kind = "rebuild" if self.tree_changes else "sync"
+            self.counters["coalesced"] += self.batches - 1
+            self.tree_changes = set()
+            self.sb3_changed = False
+            self.batches = 0
+            self.first_change = self.last_change = None
+            self.running = kind
+            self.cancel_event = threading.Event()
+            return kind, self.cancel_event
+
+    def _loop(self):
+        if self.content:
+            # Catch up on whatever happened while the project wasn't open
+            with metrics.span("scheduler.index"):
+                files = snapshot_dir(self.proj_dir).keys() | {self.sb3_path}
+                self.content.refresh(files, prune=True)
+                self.content.save()
+
+        while True:
+            job = self._wait_for_job()
+            if job is None:
+                return
+            kind, cancel_event = job
+
+            cancelled = False
+            before = snapshot_dir(self.proj_dir, include_dirs=True) if kind == "sync" else None
+            try:
+                with metrics.span("scheduler.job", kind=kind):
+                    if kind == "rebuild":
+                        ok = self.rebuild(cancel_event.is_set)
+                    else:
+                        ok = self.sync()
+            except Cancelled:
+                ok = False
+                cancelled = True
+            except Exception as e:
+                print(f"[Scheduler] {kind} failed: {e}")
+                ok = False
+
+            after = snapshot_dir(self.proj_dir, include_dirs=True) if ok and kind == "sync" else None
+            if ok and self.content:
+                # What the job wrote is the content everything else is compared to now
+                self.content.refresh(after if kind == "sync" else [self.sb3_path])
+                self.content.save()
+
+            with self.cond:
+                self.running = None
+                self.counters[kind + "s"] += 1
+                if cancelled:
+                    self.counters["cancelled"] += 1
+                    self.retrying = True
+                    # The newer changes are already pending; make sure the retry
+                    # happens even if they turn out to be our own writes
+                    self.tree_changes.add(self.proj_dir)
+                    self.first_change = self.first_change or time.monotonic()
+                    self.last_change = self.last_change or self.first_change
+                else:
+                    self.retrying = False
+                    if not ok:
+                        self.counters["failed"] += 1
+
+                if ok and kind == "rebuild":
+                    self.expected[self.sb3_path] = snapshot_file(self.sb3_path)
+                elif ok and kind == "sync":
+                    self.expected = {path: None for path in before.keys() - after.keys()}
+                    self.expected.update(after)
+
+                # Changes that came in while the job ran may have been its own writes
+                real = {p for p in self.tree_changes if not self._self_write(p)}
+                self.counters["suppressed"] += len(self.tree_changes) - len(real)
+                self.tree_changes = real
+                if self.sb3_changed and self._self_write(self.sb3_path):
+                    self.counters["suppressed"] += 1
+                    self.sb3_changed = False
+                if not self._has_pending():
+                    self.batches = 0
+                    self.first_change = self.last_change = None
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                **self.counters,
+                "pending_paths": len(self.tree_changes) + int(self.sb3_changed),
+                "queued": int(self._has_pending()),
+                "running": self.running,
+            }
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            if self.cancel_event:
+                self.cancel_event.set()
+            self.cond.notify_all()
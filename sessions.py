@@ -0,0 +1,468 @@
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from eventbus import EventBus
+from fswatch import ContentIndex, open_watcher
+from jsonrebuild import FragmentCache
+from progress import format_progress
+import projectdelta
+from sb3break import sync_sb3
+from sb3rebuild import Cancelled, rebuild_sb3
+from scheduler import BuildScheduler
+
+
+def log_progress(event):
+    print(format_progress(event))
+
+
+def project_id(proj_dir):
+    """
+    Short stable id for a project folder, used to address it in the API.
+    """
+    path = os.path.normcase(os.path.abspath(proj_dir))
+    return hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+
+
+def project_version(sb3_path):
+    """
+    Cheap version tag for the .sb3, changes whenever the file is rewritten.
+    """
+    try:
+        stat = os.stat(sb3_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return version_tag(stat)
+
+
+# BuildScheduler.stats() keys that are levels rather than running totals
+SCHEDULER_GAUGES = ("pending_paths", "queued")
+
+
+def version_tag(stat):
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+# Set in build worker processes, see BuildLane
+_worker_events = None
+_worker_cancelled = None
+# proj_dir -> FragmentCache of the projects pinned to this worker
+_worker_caches = {}
+
+
+def _init_worker(events, cancelled):
+    global _worker_events, _worker_cancelled
+    _worker_events, _worker_cancelled = events, cancelled
+
+
+def _worker_job(job_id, fn, args, kwargs, cancellable):
+    """
+    Runs one BuildPool job in a worker. Its progress events go back through the
+    events queue, ended by a None; the metrics it recorded come back with its
+    result, or with the exception it raised.
+    """
+    kwargs["progress"] = lambda event: _worker_events.put((job_id, event))
+    if cancellable:
+        kwargs["cancel"] = lambda: _worker_cancelled.value == job_id
+    try:
+        result = True, fn(*args, **kwargs)
+    except Exception as e:
+        result = False, e
+    finally:
+        _worker_events.put((job_id, None))
+    return (*result, metrics.drain())
+
+
+def _forget(proj_dir):
+    _worker_caches.pop(proj_dir, None)
+
+
+def rebuild_project(proj_dir, progress=log_progress, cancel=None):
+    """
+    rebuild_sb3 with the project's FragmentCache, which stays in memory for the
+    next rebuild as long as it runs in the same process.
+    """
+    cache = _worker_caches.get(proj_dir)
+    if cache is None:
+        cache = _worker_caches[proj_dir] = FragmentCache(os.path.join(proj_dir, "_bvcache", "fragments.cache"))
+    return rebuild_sb3(proj_dir, cache=cache, progress=progress, cancel=cancel)
+
+
+class BuildLane:
+    """
+    One build worker process, started on first use, and the projects pinned to it.
+    `cancelled` holds the id of the job the worker should give up on.
+    """
+
+    def __init__(self, context, events):
+        self.context = context
+        self.events = events
+        self.cancelled = context.RawValue("q", 0)
+        self.projects = set()
+        self.executor = None
+
+    def submit(self, fn, *args):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=self.context, initializer=_init_worker,
+                                                initargs=(self.events, self.cancelled))
+        return self.executor.submit(fn, *args)
+
+    def reset(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class BuildPool:
+    """
+    Long-lived worker processes shared by every project's sync/rebuild jobs, so
+    parsing and packing run on as many cores as there are workers rather than
+    taking turns on the GIL. Each project is pinned to one worker, which keeps its
+    fragment cache warm, and a busy project never takes over more than that one.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.environ.get("BLOCKVINE_BUILD_WORKERS") or min(4, os.cpu_count() or 1))
+        # Not fork: the backend's other threads may hold locks that the child would inherit held
+        self.context = multiprocessing.get_context("spawn")
+        self.lanes = []
+        # key -> BuildLane
+        self.pinned = {}
+        # job id -> (progress callback, set once the worker has sent its last event)
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.events = None
+        # Work nobody waits for, kept off the build workers so it never holds up a build
+        self.idle = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blockvine-idle")
+
+    def _lane(self, key):
+        with self.lock:
+            if self.events is None:
+                self.events = self.context.Queue()
+                self.lanes = [BuildLane(self.context, self.events) for _ in range(self.workers)]
+                threading.Thread(target=self._forward_events, daemon=True, name="blockvine-build-events").start()
+            lane = self.pinned.get(key)
+            if lane is None:
+                lane = self.pinned[key] = min(self.lanes, key=lambda lane: len(lane.projects))
+                lane.projects.add(key)
+            return lane
+
+    def _forward_events(self):
+        while True:
+            job_id, event = self.events.get()
+            progress, finished = self.jobs.get(job_id, (None, None))
+            if finished is None:
+                continue
+            if event is None:
+                finished.set()
+            elif progress:
+                progress(event)
+
+    def run(self, fn, *args, key=None, progress=log_progress, lock=None, cancel=None, **kwargs):
+        """
+        Runs fn(*args, progress=..., **kwargs) in the worker `key` is pinned to and
+        waits for it. With `cancel`, fn gets a cancel= callback too, which turns
+        true once `cancel()` does. fn, its arguments and its result go between
+        processes, so they have to be picklable. Jobs sharing a `lock` never overlap.
+        """
+        with lock or contextlib.nullcontext():
+            lane = self._lane(key)
+            job_id = next(self.job_ids)
+            finished = threading.Event()
+            self.jobs[job_id] = (progress, finished)
+            try:
+                future = lane.submit(_worker_job, job_id, fn, args, kwargs, cancel is not None)
+                while True:
+                    try:
+                        ok, value, recorded = future.result(timeout=0.05 if cancel else None)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        if not cancel():
+                            continue
+                        if future.cancel():
+                            raise Cancelled(f"{fn.__name__} was cancelled before it started")
+                        lane.cancelled.value = job_id
+                # Events are sent separately from the result, let them all through first
+                finished.wait(5)
+            except BrokenProcessPool:
+                # The worker died (killed, out of memory); the next job gets a new one
+                lane.reset()
+                raise
+            finally:
+                self.jobs.pop(job_id, None)
+        metrics.merge(*recorded)
+        if not ok:
+            raise value
+        return value
+
+    def release(self, key):
+        """
+        Unpins `key`, and has its worker drop what it kept for it.
+        """
+        with self.lock:
+            lane = self.pinned.pop(key, None)
+            if lane:
+                lane.projects.discard(key)
+        if lane and lane.executor is not None:
+            lane.executor.submit(_forget, key)
+
+    def later(self, fn, *args):
+        """
+        Runs fn in the background without waiting for it.
+        """
+        return self.idle.submit(fn, *args)
+
+
+class ProjectSession:
+    """
+    One open project: its watcher and BuildScheduler (on the session's own thread)
+    and event stream. Builds go to the shared BuildPool, whose worker for this
+    project keeps its fragment cache; the git state lives in the shared
+    GitStateCache, keyed by the project folder.
+    """
+
+    def __init__(self, proj_dir, pool, git_cache):
+        self.proj_dir = proj_dir
+        self.sb3_path = f"{proj_dir}.sb3"
+        self.id = project_id(proj_dir)
+        self.pool = pool
+        self.git_cache = git_cache
+        # Reload/sync notifications for the editors showing this project, see /cmd/events
+        self.event_bus = EventBus()
+        # version -> projectdelta summary of the last few .sb3 versions, for /cmd/projectDelta
+        self.summaries = collections.OrderedDict()
+        self.summaries_lock = threading.Lock()
+        # Keeps this project's jobs in order even when the pool has free workers
+        self.build_lock = threading.Lock()
+        self.scheduler = None
+        self.opened = time.time()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True,
+                                       name=f"blockvine-watch-{os.path.basename(proj_dir)}")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    @metrics.timed("reload")
+    def rebuild(self, cancel=None):
+        print(f"Reloading {self.proj_dir}!")
+        try:
+            self.pool.run(rebuild_project, self.proj_dir, key=self.proj_dir, cancel=cancel, lock=self.build_lock)
+            print(f"Reload OK")
+        except Cancelled:
+            print(f"Reload superseded by newer changes")
+            raise
+        except Exception as e:
+            print(f"Failed to reload: {e}")
+            return False
+        self.event_bus.publish("reload", reason="rebuild", path=self.proj_dir, project=self.id,
+                               version=project_version(self.sb3_path))
+        # Remember this version now, so an editor that loads it can get a delta later
+        self.pool.later(self.summary)
+        return True
+
+    @metrics.timed("sync")
+    def sync(self):
+        print(f"Syncing {self.proj_dir} with editor!")
+        try:
+            if "BlockVine" in self.proj_dir:
+                self.pool.run(sync_sb3, self.sb3_path, self.proj_dir, key=self.proj_dir, lock=self.build_lock)
+            else:
+                raise Exception("Current project directory is not a BlockVine directory.")
+            print(f"Sync OK")
+        except Exception as e:
+            print(f"Failed to sync: {e}")
+            return False
+        # The version the editor saved, which is what it has loaded now
+        self.event_bus.publish("sync", path=self.proj_dir, project=self.id,
+                               version=project_version(self.sb3_path))
+        self.pool.later(self.summary)
+        return True
+
+    def summary(self, version=None):
+        """
+        The projectdelta summary of the .sb3 as it is now, remembered under its version
+        so later versions can be diffed against it. With `version`, the remembered one
+        (None if it was never seen or has been forgotten).
+        """
+        with self.summaries_lock:
+            if version is not None and version in self.summaries:
+                return self.summaries[version]
+            current = project_version(self.sb3_path)
+            if current is None or (version is not None and version != current):
+                return None
+            if current not in self.summaries:
+                try:
+                    stat, summary = projectdelta.summarize(self.sb3_path)
+                except Exception as e:
+                    print(f"Could not read {self.sb3_path} for deltas: {e}")
+                    return None
+                current = summary["version"] = version_tag(stat)
+                self.summaries[current] = summary
+                # Only the newest version's JSON is ever sent, the rest only need digests
+                for old in list(self.summaries)[:-1]:
+                    self.summaries[old].pop("texts", None)
+                while len(self.summaries) > 32:
+                    self.summaries.popitem(last=False)
+            return self.summaries[current]
+
+    def delta(self, since):
+        """
+        What an editor that has version `since` loaded needs to catch up: a dict with
+        the current version and either the JSON of the sprites that changed, or
+        full=True and the reason a full reload is needed.
+        """
+        current = self.summary()
+        if current is None:
+            return {"version": None, "full": True, "reason": "the project has no .sb3 yet"}
+        version = current["version"]
+        base = self.summary(since) if since else None
+        if base is None or "texts" not in current:
+            return {"version": version, "full": True, "reason": "unknown base version"}
+
+        reason, changed = projectdelta.diff(base, current)
+        if reason:
+            return {"version": version, "full": True, "reason": reason}
+        return {"version": version, "full": False, "changed": changed,
+                "targets": [current["texts"][name] for name in changed]}
+
+    def _watch(self):
+        watcher = None
+
+        while not self.closed.is_set():
+            if not os.path.isdir(self.proj_dir):
+                if watcher:
+                    watcher.close()
+                    self.scheduler.close()
+                    watcher = self.scheduler = None
+                self.closed.wait(1)
+                continue
+
+            try:
+                if watcher is None:
+                    watcher = open_watcher(self.proj_dir, self.sb3_path)
+                    # Rebuilds/syncs run on the scheduler's thread, so this loop never blocks on them
+                    content = ContentIndex(os.path.join(self.proj_dir, "_bvcache", "content.index"))
+                    self.scheduler = BuildScheduler(self.proj_dir, self.sb3_path, rebuild=self.rebuild, sync=self.sync,
+                                                    content=content)
+                    print(f"[Watcher] Watching {self.proj_dir} ({type(watcher).__name__})")
+
+                # The timeout only bounds how long it takes to notice close()
+                changed = watcher.wait(timeout=1)
+                if not changed:
+                    continue
+
+                shown = sorted(changed)[:5]
+                more = f" (+{len(changed) - len(shown)} more)" if len(changed) > len(shown) else ""
+                print(f"[Watcher] Changed: {', '.join(shown)}{more}")
+
+                self.scheduler.submit(changed)
+                # Whatever it was, the worktree may differ now, so git status has to be re-read
+                self.git_cache.invalidate(self.proj_dir)
+
+            except Exception as e:
+                print(f"[Watcher] Error: {e}")
+
+        if watcher:
+            watcher.close()
+            self.scheduler.close()
+        print(f"[Watcher] Stopped watching {self.proj_dir}")
+
+    def stats(self):
+        scheduler = self.scheduler
+        return scheduler.stats() if scheduler else {}
+
+    def close(self):
+        self.closed.set()
+        self.git_cache.forget(self.proj_dir)
+        self.pool.release(self.proj_dir)
+
+
+class SessionManager:
+    """
+    The open projects by id. The last one opened is the default for clients that
+    don't say which project they mean (older userscripts, the tray).
+    """
+
+    def __init__(self, pool, git_cache):
+        self.pool = pool
+        self.git_cache = git_cache
+        self.sessions = {}
+        self.default_id = None
+        self.lock = threading.Lock()
+        # Counters of closed sessions, so the totals never go down
+        self.retired = {}
+        self.retired_events = 0
+
+    def open(self, proj_dir):
+        """
+        Returns the session for proj_dir, starting one if it isn't open yet,
+        and makes it the default.
+        """
+        proj_dir = os.path.abspath(proj_dir)
+        pid = project_id(proj_dir)
+        with self.lock:
+            session = self.sessions.get(pid)
+            if session is None:
+                session = self.sessions[pid] = ProjectSession(proj_dir, self.pool, self.git_cache).start()
+            session.opened = time.time()
+            self.default_id = pid
+            return session
+
+    def get(self, pid=None):
+        """
+        The session with id `pid`, or the default one without an id. None if there is none.
+        """
+        with self.lock:
+            return self.sessions.get(pid or self.default_id)
+
+    def close(self, pid):
+        with self.lock:
+            session = self.sessions.pop(pid, None)
+            if session:
+                for key, value in session.stats().items():
+                    if key not in SCHEDULER_GAUGES and isinstance(value, int):
+                        self.retired[key] = self.retired.get(key, 0) + value
+                self.retired_events += session.event_bus.latest
+            if self.default_id == pid:
+                # Fall back to the most recently opened of the others
+                latest = max(self.sessions.values(), key=lambda s: s.opened, default=None)
+                self.default_id = latest.id if latest else None
+        if session:
+            session.close()
+        return session
+
+    def all(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def stats(self):
+        """
+        Scheduler counters summed over every project opened so far, and queue
+        depths (SCHEDULER_GAUGES) over the open ones.
+        """
+        with self.lock:
+            totals = dict(self.retired)
+        for session in self.all():
+            for key, value in session.stats().items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def events_published(self):
+        """
+        Events published by every project opened so far.
+        """
+        with self.lock:
+            return self.retired_events + sum(session.event_bus.latest for session in self.sessions.values())
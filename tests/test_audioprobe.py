@@ -0,0 +1,26 @@
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audioprobe
+
+
+class TruncatedHeaderTest(unittest.TestCase):
+    """
+    probe_duration returns None instead of raising when the headers are cut short.
+    """
+
+    def test_truncated_ogg(self):
+        self.assertIsNone(audioprobe.probe_duration(io.BytesIO(b"OggS" + b"\0" * 10)))
+
+    def test_truncated_id3(self):
+        for data in (b"ID3", b"ID3\x03\x00", b"ID3\x03\x00\x00\x00\x00\x00"):
+            with self.subTest(data=data):
+                self.assertIsNone(audioprobe.probe_duration(io.BytesIO(data)))
+
+
+if __name__ == "__main__":
+    unittest.main()
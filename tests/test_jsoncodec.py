@@ -0,0 +1,23 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsoncodec
+
+
+class RoundTripTest(unittest.TestCase):
+    """
+    Every available backend parses and writes the sample exactly like stdlib json.
+    """
+
+    def test_sample(self):
+        data = jsoncodec.SAMPLE.encode("utf-8")
+        for name in jsoncodec.BACKENDS:
+            with self.subTest(backend=name):
+                self.assertEqual([m for m in jsoncodec.check_roundtrip(data) if m[0] == name], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
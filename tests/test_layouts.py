@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsoncodec
+from jsonbreak import LAYOUTS, disassemble_json
+from jsonrebuild import rebuild_json, rebuild_json_text
+
+PROJECT = {
+    "targets": [
+        {
+            "isStage": True,
+            "name": "Stage",
+            "variables": {},
+            "blocks": {},
+            "costumes": [],
+        },
+        {
+            "isStage": False,
+            "name": "Sprite1",
+            "blocks": {
+                "a": {"opcode": "event_whenflagclicked", "next": "b", "parent": None, "topLevel": True},
+                "b": {"opcode": "motion_movesteps", "next": None, "parent": "a", "topLevel": False},
+                "c": {"opcode": "event_whenkeypressed", "next": None, "parent": None, "topLevel": True},
+            },
+            "x": 0,
+        },
+        # No "blocks" key at all
+        {"isStage": False, "name": "Sprite2", "x": 10, "y": -5},
+    ],
+    "monitors": [],
+    "meta": {"semver": "3.0.0"},
+}
+
+
+class LayoutRoundTripTest(unittest.TestCase):
+    """
+    Every layout rebuilds the targets it was given exactly, key order included.
+    """
+
+    def test_round_trip(self):
+        for layout in LAYOUTS:
+            with self.subTest(layout=layout), tempfile.TemporaryDirectory() as tmp:
+                src = os.path.join(tmp, "src")
+                disassemble_json(PROJECT, src, layout=layout)
+
+                self.assertEqual(rebuild_json(src), PROJECT)
+                text = rebuild_json_text(src)
+                self.assertEqual(json.loads(text), PROJECT)
+                for expected, target in zip(PROJECT["targets"], json.loads(text)["targets"]):
+                    self.assertEqual(jsoncodec.dumps(target), jsoncodec.dumps(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
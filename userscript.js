@@ -5,41 +5,216 @@
        Reload watcher
     ------------------------------*/
 
-    function base64ToUint8Array(base64) {
-        console.log("converting to uint8array");
-        const binary = atob(base64);
-        const bytes = new Uint8Array(binary.length);
-        for (let i = 0; i < binary.length; i++) {
-            bytes[i] = binary.charCodeAt(i);
+    let lastPath = null;
+    // The project this window shows, and an id so the backend can tell windows apart
+    let projectId = null;
+    const clientId = Math.random().toString(36).slice(2);
+    let events = null;
+    let loadedVersion = null;
+    // The version the VM holds, which deltas are asked for against
+    let vmVersion = null;
+    let projdata = null;
+    let reloading = false;
+    let reloadQueued = false;
+    let initLoad = true;
+
+    // Only downloads the project when its version changed since the last fetch
+    async function fetchProject(version) {
+        if (projdata && version === loadedVersion) return projdata;
+
+        const res = await fetch(
+            `http://localhost:8617/cmd/project.sb3?project=${projectId}&v=${encodeURIComponent(version)}`,
+            { cache: 'no-store' }
+        );
+        if (!res.ok) return null;
+
+        projdata = new Uint8Array(await res.arrayBuffer());
+        loadedVersion = version;
+        return projdata;
+    }
+
+    /* -----------------------------
+       Sprite patching
+    ------------------------------*/
+
+    // Compressed inputs in sb3 blocks, see scratch-vm's serialization/sb3.js
+    const PRIMITIVES = {
+        4: ['math_number', 'NUM'],
+        5: ['math_positive_number', 'NUM'],
+        6: ['math_whole_number', 'NUM'],
+        7: ['math_integer', 'NUM'],
+        8: ['math_angle', 'NUM'],
+        9: ['colour_picker', 'COLOUR'],
+        10: ['text', 'TEXT'],
+        11: ['event_broadcast_menu', 'BROADCAST_OPTION', 'broadcast_msg'],
+        12: ['data_variable', 'VARIABLE', ''],
+        13: ['data_listcontents', 'LIST', 'list']
+    };
+    const SOUP = '!#%()*+,-./:;=?@[]^_`{|}~ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789';
+
+    function uid() {
+        let id = '';
+        for (let i = 0; i < 20; i++) id += SOUP[Math.floor(Math.random() * SOUP.length)];
+        return id;
+    }
+
+    function deserializeInput(desc, parent, shadow, blocks) {
+        if (!Array.isArray(desc)) return desc;
+        const [opcode, field, variableType] = PRIMITIVES[desc[0]];
+        const block = {
+            id: uid(), opcode, next: null, parent, shadow, inputs: {}, topLevel: false,
+            fields: { [field]: { name: field, value: desc[1] } }
+        };
+        if (variableType !== undefined) {
+            block.fields[field].id = desc[2];
+            block.fields[field].variableType = variableType;
+            // Loose variable/list reporters lying around in the workspace
+            if (desc.length > 3) Object.assign(block, { topLevel: true, x: desc[3], y: desc[4] });
         }
-        return bytes;
+        blocks[block.id] = block;
+        return block.id;
     }
 
-    let lastPath = null;
-    let projdata = null;
-    let polling = false;
-    let initPoll = true;
+    // sb3 blocks -> the VM's own block objects
+    function deserializeBlocks(sb3Blocks) {
+        const blocks = {};
+        for (const [id, sb3Block] of Object.entries(sb3Blocks)) {
+            if (Array.isArray(sb3Block)) {
+                deserializeInput(sb3Block, null, false, blocks);
+                continue;
+            }
+            const block = { ...sb3Block, id, inputs: {}, fields: {} };
+            for (const [name, [kind, desc, shadowDesc]] of Object.entries(sb3Block.inputs || {})) {
+                const input = block.inputs[name] = { name, block: null, shadow: null };
+                if (kind === 1) {
+                    input.block = input.shadow = deserializeInput(desc, id, true, blocks);
+                } else {
+                    input.block = deserializeInput(desc, id, false, blocks);
+                    if (kind === 3) input.shadow = deserializeInput(shadowDesc, id, true, blocks);
+                }
+            }
+            for (const [name, desc] of Object.entries(sb3Block.fields || {})) {
+                if (!Array.isArray(desc)) {
+                    block.fields[name] = desc;
+                    continue;
+                }
+                const field = block.fields[name] = { name, value: desc[0] };
+                if (desc.length > 1) field.id = desc[1];
+                if (name === 'BROADCAST_OPTION') field.variableType = 'broadcast_msg';
+                else if (name === 'VARIABLE') field.variableType = '';
+                else if (name === 'LIST') field.variableType = 'list';
+            }
+            blocks[id] = block;
+        }
+        return blocks;
+    }
+
+    function patchVariables(target, sprite) {
+        const wanted = {};
+        for (const [id, [name, value, isCloud]] of Object.entries(sprite.variables || {})) {
+            wanted[id] = { name, value, type: '', isCloud: !!isCloud };
+        }
+        for (const [id, [name, value]] of Object.entries(sprite.lists || {})) {
+            wanted[id] = { name, value: [...value], type: 'list', isCloud: false };
+        }
+        for (const [id, variable] of Object.entries(target.variables)) {
+            if (!wanted[id] || wanted[id].type !== variable.type) target.deleteVariable(id);
+        }
+        for (const [id, { name, value, type, isCloud }] of Object.entries(wanted)) {
+            if (!target.variables[id]) target.createVariable(id, name, type, isCloud);
+            Object.assign(target.variables[id], { name, value, isCloud });
+            if (type === 'list') target.variables[id]._monitorUpToDate = false;
+        }
+    }
 
-    async function pollBlockVine() {
-        if (polling) return;
-        polling = true;
+    // Swaps a loaded sprite's code, variables and position for the ones in `sprite`
+    // (its sb3 JSON). Costumes and sounds stay, the backend only sends sprites
+    // whose assets didn't change.
+    function patchSprite(sprite) {
+        const target = vm.runtime.getSpriteTargetByName(sprite.name);
+        if (!target) throw new Error(`No sprite called ${sprite.name}`);
+
+        // The blocks container is shared with the sprite's clones
+        for (const clone of target.sprite.clones) vm.runtime.stopForTarget(clone);
+        const blocks = target.blocks;
+        blocks.deleteAllBlocks();
+        for (const block of Object.values(deserializeBlocks(sprite.blocks || {}))) blocks.createBlock(block);
+        blocks.resetCache();
+
+        patchVariables(target, sprite);
+        target.comments = {};
+        for (const [id, c] of Object.entries(sprite.comments || {})) {
+            target.createComment(id, c.blockId, c.text, c.x, c.y, c.width, c.height, c.minimized);
+        }
+
+        target.setXY(sprite.x, sprite.y);
+        target.setDirection(sprite.direction);
+        target.setSize(sprite.size);
+        target.setVisible(sprite.visible);
+        target.setDraggable(sprite.draggable);
+        target.setRotationStyle(sprite.rotationStyle);
+        target.setCostume(sprite.currentCostume);
+        if (typeof sprite.volume === 'number') target.volume = sprite.volume;
+        return target;
+    }
+
+    // Brings the VM up to date by patching only the sprites that changed.
+    // Returns false when that isn't possible and the whole project has to be loaded.
+    async function patchProject() {
+        if (!vmVersion) return false;
+
+        const res = await fetch(
+            `http://localhost:8617/cmd/projectDelta?project=${projectId}&since=${encodeURIComponent(vmVersion)}`,
+            { cache: 'no-store' }
+        );
+        if (!res.ok) return false;
+        const delta = await res.json();
+        if (delta.full) {
+            console.log(`BlockVine: full reload, ${delta.reason}`);
+            return false;
+        }
+
+        try {
+            const patched = delta.targets.map(patchSprite);
+            if (patched.length) {
+                vm.emitTargetsUpdate(false);
+                if (patched.includes(vm.editingTarget)) vm.emitWorkspaceUpdate();
+            }
+        } catch (e) {
+            console.warn('BlockVine: patching failed, reloading everything', e);
+            return false;
+        }
+        vmVersion = delta.version;
+        console.log(`BlockVine: patched ${delta.changed.join(', ') || 'nothing'}`);
+        return true;
+    }
+
+    async function reloadBlockVine(force) {
+        if (reloading) {
+            reloadQueued = true;
+            return;
+        }
+        reloading = true;
 
         try {
-            const res = await fetch('http://localhost:8617/cmd/getInfo');
+            let res = await fetch(`http://localhost:8617/cmd/getInfo${projectId ? `?project=${projectId}` : ''}`);
+            if (res.status === 404) {
+                // The backend restarted or the project was closed: take whatever is open now
+                res = await fetch('http://localhost:8617/cmd/getInfo');
+            }
             if (!res.ok) return;
 
             const info = await res.json();
+            if (info.project !== projectId) connect(info.project);
 
             const path = String(info.path ?? '');
 
-            const hasReload = info.action_queue?.at(-1) === 'reload';
-
             const shouldReload =
-                hasReload ||
+                force ||
                 path !== lastPath;
 
-            if (shouldReload && typeof vm !== 'undefined' && info.projdata) {
-                if (path !== lastPath && !initPoll) {
+            if (shouldReload && typeof vm !== 'undefined' && info.version) {
+                if (path !== lastPath && !initLoad) {
                     EditorPreload.openNewWindow();
                     document.body.innerHTML = '🌱 Please close this window.';
                     requestAnimationFrame(() => {
@@ -48,18 +223,67 @@
                         });
                     });
                 }
+                const samePath = path === lastPath;
                 lastPath = path;
-                const projdata = base64ToUint8Array(info.projdata);
+                if (samePath && await patchProject()) return;
+
+                const bytes = await fetchProject(info.version);
+                if (!bytes) return;
                 console.log("reloading!");
-                await vm.loadProject(projdata);
+                await vm.loadProject(bytes);
+                vmVersion = info.version;
             }
         } finally {
-            polling = false;
-            initPoll = false;
+            reloading = false;
+            initLoad = false;
+            if (reloadQueued) {
+                reloadQueued = false;
+                reloadBlockVine(true);
+            }
         }
     }
 
-    setInterval(pollBlockVine, 1000);
+    // Another project was opened from a sidebar. Only the window whose sidebar
+    // it was follows it (windows without a project too); reloadBlockVine then
+    // moves it to a new editor window like any other project switch.
+    function onProjectOpened(e) {
+        const data = JSON.parse(e.data);
+        if (data.project === projectId) return;
+        if (projectId && data.client !== clientId) return;
+        connect(data.project);
+        reloadBlockVine(true);
+    }
+
+    // The backend pushes events as they happen; EventSource reconnects on its own
+    // and resumes from the last event id it saw. Each project has its own stream,
+    // windows without one listen for projects being opened.
+    function connect(id) {
+        if (events) events.close();
+        projectId = id;
+        events = new EventSource(`http://localhost:8617/cmd/events${id ? `?project=${id}` : ''}`);
+        events.addEventListener('open', () => reloadBlockVine(false));
+        events.addEventListener('reload', () => reloadBlockVine(true));
+        events.addEventListener('resync', () => {
+            // Events were missed, so don't trust a delta either
+            vmVersion = null;
+            reloadBlockVine(true);
+        });
+        // The editor saved the project, so that version is what the VM has
+        events.addEventListener('sync', (e) => {
+            const version = JSON.parse(e.data).version;
+            if (version) vmVersion = version;
+        });
+        events.addEventListener('opened', onProjectOpened);
+        // A non-200 answer makes EventSource give up for good, so start over from the lobby
+        events.addEventListener('error', () => {
+            if (events.readyState !== EventSource.CLOSED) return;
+            setTimeout(() => {
+                if (events.readyState === EventSource.CLOSED) connect(null);
+            }, 1000);
+        });
+    }
+
+    connect(null);
 
     /* -----------------------------
        UI integration
@@ -183,7 +407,10 @@
                     sidebar.appendChild(titleBar);
 
                     const iframe = document.createElement('iframe');
-                    iframe.src = 'http://localhost:8617/gui';
+                    iframe.src = `http://localhost:8617/gui?${new URLSearchParams({
+                        ...(projectId ? { project: projectId } : {}),
+                        client: clientId
+                    })}`;
                     Object.assign(iframe.style, {
                         flex: '1',
                         border: 'none',